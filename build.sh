@@ -4,4 +4,6 @@ pip install -r requirements.txt
 
 python manage.py collectstatic --noinput
 
+python manage.py check --deploy
+
 python manage.py migrate
\ No newline at end of file
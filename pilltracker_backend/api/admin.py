@@ -1,9 +1,11 @@
 from django.contrib import admin
-from .models import Patient, Doctor, PillSchedule, PillIntake, PillBoxStatus, Alert
+from .models import Patient, Doctor, PillSchedule, PillIntake, PillBoxStatus, PillBox, Alert, Notification
 
 admin.site.register(Patient)
 admin.site.register(Doctor)
 admin.site.register(PillSchedule)
 admin.site.register(PillIntake)
 admin.site.register(PillBoxStatus)
+admin.site.register(PillBox)
 admin.site.register(Alert)
+admin.site.register(Notification)
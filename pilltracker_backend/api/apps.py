@@ -1,4 +1,3 @@
-import os
 from django.apps import AppConfig
 
 
@@ -10,10 +9,7 @@ class ApiConfig(AppConfig):
 
     def ready(self):
 
-        # Prevent duplicate scheduler
-        if os.environ.get('RUN_MAIN') != 'true':
-            return
+        from . import checks, signals  # noqa: F401
 
-        from .scheduler import start
-
-        start()
\ No newline at end of file
+        # Scheduling, MQTT and ingestion run in their own process:
+        # manage.py run_dispatcher (Procfile "worker")
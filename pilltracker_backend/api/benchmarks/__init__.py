@@ -0,0 +1,6 @@
+"""
+Synthetic-load benchmarks. Run through ``manage.py run_benchmarks``,
+which builds a throwaway database, fills it with
+:func:`generator.generate` and writes the timings from :mod:`suite`
+as JSON.
+"""
@@ -0,0 +1,200 @@
+import random
+from datetime import time, timedelta
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from ..models import (
+    Doctor,
+    Patient,
+    PillSchedule,
+    PillIntake,
+    PillBoxStatus,
+    PillBox,
+    Alert,
+    RefillLog,
+    Medication,
+    Dispense,
+    DoseInstance
+)
+from ..doses import doses_for, horizon
+from ..recurrence import due_at, next_occurrence
+
+
+def chunks(rows, size):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def bulk(model, rows, batch_size):
+    created = []
+
+    for batch in chunks(rows, batch_size):
+        created.extend(model.objects.bulk_create(batch))
+
+    return created
+
+
+def generate(patients=1000, patients_per_doctor=100, medications_per_patient=5,
+             schedules_per_patient=3, history_days=1, alerts_per_patient=2,
+             due_fraction=0.01, seed=0, batch_size=5000):
+    """
+    Fill the current database with a synthetic dataset. Dose times are
+    spread uniformly over the day, so roughly 1/1440 of the medications
+    are due in any given minute, except for ``due_fraction`` of them,
+    which are due at generation time so that check_medications has doses
+    to dispatch. Dose instances are materialized from the start of the
+    history window through the horizon; a schedule's past doses without
+    an intake stay pending, so the missed-dose sweep has work too.
+    Returns the row count per model.
+    """
+    rng = random.Random(seed)
+    today = timezone.localdate()
+
+    def random_time():
+        minute = rng.randrange(24 * 60)
+        return time(minute // 60, minute % 60)
+
+    doctor_count = max(1, patients // patients_per_doctor)
+
+    users = bulk(User, [
+        User(username=f"bench_doctor_{i}")
+        for i in range(doctor_count)
+    ], batch_size)
+
+    doctors = bulk(Doctor, [
+        Doctor(user=user, specialization="General")
+        for user in users
+    ], batch_size)
+
+    patient_rows = bulk(Patient, [
+        Patient(
+            doctor=doctors[i % doctor_count],
+            name=f"Patient {i}",
+            age=rng.randint(40, 90),
+            email=f"bench_patient_{i}@example.com"
+        )
+        for i in range(patients)
+    ], batch_size)
+
+    bulk(PillBox, [
+        PillBox(device_id=f"bench-box-{patient.pk}", patient=patient)
+        for patient in patient_rows
+    ], batch_size)
+
+    bulk(PillBoxStatus, [
+        PillBoxStatus(patient=patient, slot_status={"slot1": "filled", "slot2": "empty"})
+        for patient in patient_rows
+    ], batch_size)
+
+    schedules = bulk(PillSchedule, [
+        PillSchedule(
+            patient=patient,
+            pill_name=f"Pill {n}",
+            dosage="1",
+            time=random_time(),
+            start_date=today - timedelta(days=history_days),
+            end_date=today + timedelta(days=30)
+        )
+        for patient in patient_rows
+        for n in range(schedules_per_patient)
+    ], batch_size)
+
+    # Roughly 80% adherence over the history window
+    intakes = bulk(PillIntake, [
+        PillIntake(
+            schedule=schedule,
+            date=today - timedelta(days=day),
+            taken=True,
+            taken_time=schedule.time
+        )
+        for schedule in schedules
+        for day in range(1, history_days + 1)
+        if rng.random() < 0.8
+    ], batch_size)
+
+    medication_rows = [
+        Medication(
+            patient=patient,
+            name=f"Med {n}",
+            dosage="1",
+            time=random_time(),
+            compartment=n + 1,
+            start_date=today - timedelta(days=history_days)
+        )
+        for patient in patient_rows
+        for n in range(medications_per_patient)
+    ]
+
+    # bulk_create skips the pre_save signal that schedules each row
+    now = timezone.now()
+    local_now = timezone.localtime(now)
+    due_time = time(local_now.hour, local_now.minute)
+    due_count = 0
+
+    for med in medication_rows:
+        if rng.random() < due_fraction:
+            # Due this minute (patients are in the server time zone)
+            med.time = due_time
+            med.next_due_at = due_at(local_now.date(), due_time, local_now.tzinfo)
+            due_count += 1
+        else:
+            med.next_due_at = next_occurrence(med, now)
+
+    medications = bulk(Medication, medication_rows, batch_size)
+
+    # bulk_create skips the post_save signal that materializes doses
+    history_start = now - timedelta(days=history_days)
+    taken = {(intake.schedule_id, intake.date) for intake in intakes}
+
+    dose_rows = []
+
+    for schedule in schedules:
+        for dose in doses_for(schedule, history_start, horizon(now)):
+            if dose.due_at <= now and (schedule.pk, timezone.localdate(dose.due_at)) in taken:
+                dose.status = DoseInstance.TAKEN
+            dose_rows.append(dose)
+
+    for med in medications:
+        if med.next_due_at is not None:
+            dose_rows.extend(doses_for(med, med.next_due_at, horizon(now)))
+
+    doses = bulk(DoseInstance, dose_rows, batch_size)
+
+    dispenses = bulk(Dispense, [
+        Dispense(medication=med, pill_name=med.name, compartment=med.compartment)
+        for med in medications
+        for day in range(history_days)
+    ], batch_size)
+
+    alerts = bulk(Alert, [
+        Alert(
+            patient=patient,
+            message=f"Patient missed Pill {n} dose",
+            alert_type="Missed Dose"
+        )
+        for patient in patient_rows
+        for n in range(alerts_per_patient)
+    ], batch_size)
+
+    refills = bulk(RefillLog, [
+        RefillLog(pill_name=f"Pill {i}", count=rng.randint(0, 30))
+        for i in range(patients)
+    ], batch_size)
+
+    return {
+        "doctors": len(doctors),
+        "patients": len(patient_rows),
+        "schedules": len(schedules),
+        "intakes": len(intakes),
+        "medications": len(medications),
+        "due_medications": due_count,
+        "doses": len(doses),
+        "pending_past_due": sum(
+            dose.status == DoseInstance.PENDING and dose.due_at <= now
+            for dose in doses
+        ),
+        "dispenses": len(dispenses),
+        "alerts": len(alerts),
+        "refill_logs": len(refills),
+    }
@@ -0,0 +1,112 @@
+import contextlib
+import io
+import statistics
+import time
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from ..models import Patient
+from ..scheduler import check_medications
+from ..utils import run_alert_job
+from ..views import MedicationViewSet
+
+
+LIST_ENDPOINTS = [
+    "/api/doctors/",
+    "/api/patients/",
+    "/api/schedules/",
+    "/api/intakes/",
+    "/api/pillbox/",
+    "/api/alerts/",
+    "/api/medications/",
+    "/api/refill-log/",
+]
+
+# Served from the cache when warm (see caching.py)
+CACHED_ENDPOINTS = [
+    "/api/medications/",
+]
+
+
+def timed(fn, repeat, warm=False):
+    """
+    Run ``fn`` ``repeat`` times, each inside a rolled-back transaction so
+    writing benchmarks start from the same data. The cache is cleared
+    before every run unless ``warm``, in which case one untimed run
+    fills it first. Returns wall-time statistics in milliseconds and the
+    query count of the last run.
+    """
+    samples = []
+
+    if warm:
+        with transaction.atomic(), contextlib.redirect_stdout(io.StringIO()):
+            fn()
+            transaction.set_rollback(True)
+
+    for _ in range(repeat):
+        if not warm:
+            cache.clear()
+
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    start = time.perf_counter()
+                    fn()
+                    samples.append((time.perf_counter() - start) * 1000)
+            transaction.set_rollback(True)
+
+    samples.sort()
+
+    return {
+        "repeat": repeat,
+        "min_ms": round(samples[0], 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "max_ms": round(samples[-1], 3),
+        "queries": len(queries.captured_queries),
+    }
+
+
+def medication_queryset(patient_id):
+    view = MedicationViewSet()
+    view.action = "list"
+    view.request = Request(
+        APIRequestFactory().get("/api/medications/", {"patient": patient_id})
+    )
+    return list(view.get_queryset())
+
+
+def benchmarks():
+    """
+    (name, callable, warm) triples timed by :func:`run`. Cached routes
+    are timed both cold and warm.
+    """
+    client = APIClient(SERVER_NAME="localhost")
+    patient_id = Patient.objects.order_by('id').values_list('id', flat=True).first()
+
+    cases = [
+        ("scheduler.check_medications", check_medications, False),
+        ("utils.run_alert_job", run_alert_job, False),
+        ("MedicationViewSet.get_queryset", lambda: medication_queryset(patient_id), False),
+    ]
+
+    for path in LIST_ENDPOINTS:
+        cases.append((f"GET {path}", lambda path=path: client.get(path), False))
+
+    for path in CACHED_ENDPOINTS:
+        cases.append((f"GET {path} (warm)", lambda path=path: client.get(path), True))
+
+    return cases
+
+
+def run(repeat=5, only=None):
+    return {
+        name: timed(fn, repeat, warm)
+        for name, fn, warm in benchmarks()
+        if not only or any(term in name for term in only)
+    }
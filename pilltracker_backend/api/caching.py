@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+NEXT_MEDICATION_KEY = "next-medication:{}"
+
+
+def next_medication_key(patient_id=None):
+    return NEXT_MEDICATION_KEY.format(patient_id or "all")
+
+
+def invalidate_next_medication(*patient_ids):
+    """
+    Drop the cached next medication of these patients and of the
+    unfiltered list, which may show any patient's medication. Deferred
+    until commit so a concurrent poll cannot re-cache the old rows.
+    """
+    keys = [next_medication_key(patient_id) for patient_id in patient_ids]
+    keys.append(next_medication_key())
+
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def seconds_until(fire_at):
+    """
+    Seconds until ``fire_at`` (the next medication's next_due_at). Once
+    it passes, the following medication becomes the next one, so this
+    is the natural lifetime of a cached "next medication".
+    """
+    if fire_at is None:
+        return settings.NEXT_MEDICATION_CACHE_SECONDS
+
+    if isinstance(fire_at, str):
+        fire_at = parse_datetime(fire_at)
+
+    return max(min(
+        int((fire_at - timezone.now()).total_seconds()) + 1,
+        settings.NEXT_MEDICATION_CACHE_SECONDS
+    ), 1)
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    The next-medication cache is invalidated by whichever process saved
+    or dispensed a medication. A per-process cache (locmem) never sees
+    invalidations from the other web workers or the dispatcher, so it
+    would serve stale rows in production.
+    """
+    backend = settings.CACHES["default"]["BACKEND"]
+
+    if settings.DEBUG or not backend.endswith("LocMemCache"):
+        return []
+
+    return [Error(
+        "The default cache is per-process (LocMemCache) with DEBUG off.",
+        hint="Set REDIS_URL so every process shares one cache.",
+        id="api.E001",
+    )]
@@ -0,0 +1,145 @@
+import logging
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import DoseInstance, JobWatermark, Medication, PillSchedule
+from .recurrence import occurrences, schedule_zone, zone
+
+DOSE_JOB = "dose-materialization"
+
+logger = logging.getLogger(__name__)
+
+
+def doses_for(source, start, end):
+    """
+    Unsaved DoseInstance rows for every occurrence of a Medication or
+    PillSchedule in [start, end].
+    """
+    if isinstance(source, Medication):
+        link = {"medication_id": source.pk}
+        name = source.name
+    else:
+        link = {"schedule_id": source.pk}
+        name = source.pill_name
+
+    return [
+        DoseInstance(
+            patient_id=source.patient_id,
+            name=name,
+            due_at=due_at,
+            **link
+        )
+        for due_at in occurrences(source, start, end, schedule_zone(source))
+    ]
+
+
+def horizon(now):
+    return now + timedelta(days=settings.DOSE_HORIZON_DAYS)
+
+
+def rematerialize(*sources, created=False):
+    """
+    Replace the future pending doses of Medications and PillSchedules
+    after they were saved, with one delete and one insert.
+    """
+    now = timezone.now()
+
+    if not created:
+        DoseInstance.objects.filter(
+            Q(medication_id__in=[s.pk for s in sources if isinstance(s, Medication)])
+            | Q(schedule_id__in=[s.pk for s in sources if isinstance(s, PillSchedule)]),
+            status=DoseInstance.PENDING,
+            due_at__gte=now
+        ).delete()
+
+    rows = []
+
+    for source in sources:
+        start = now
+
+        # A medication already dispensed today resumes at next_due_at
+        if isinstance(source, Medication):
+            if source.next_due_at is None:
+                continue
+            start = max(start, source.next_due_at)
+
+        rows.extend(doses_for(source, start, horizon(now)))
+
+    DoseInstance.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+
+
+def materialize_doses(chunk_size=500):
+    """
+    Rolling job: extend the dose table from the previous horizon up to
+    DOSE_HORIZON_DAYS ahead. Only medications and schedules active in
+    that window are read, ``chunk_size`` at a time, and each chunk's
+    doses are inserted before the next is read. Existing rows are left
+    alone, so runs are idempotent and an interrupted run is completed by
+    the next one. Returns the number of rows submitted.
+    """
+    now = timezone.now()
+
+    watermark = JobWatermark.objects.filter(name=DOSE_JOB).first()
+
+    start = max(watermark.value, now) if watermark else now
+    end = horizon(now)
+
+    if start >= end:
+        return 0
+
+    submitted = 0
+
+    for model in (Medication, PillSchedule):
+        # Dates are compared a day wide to allow for patient time zones
+        sources = model.objects.filter(
+            start_date__lte=end.date() + timedelta(days=1)
+        ).exclude(
+            end_date__lt=start.date() - timedelta(days=1)
+        ).annotate(
+            patient_timezone=F('patient__timezone')
+        )
+
+        rows = []
+
+        for n, source in enumerate(sources.iterator(chunk_size=chunk_size), 1):
+            rows.extend(doses_for(source, start, end))
+
+            if n % chunk_size == 0:
+                DoseInstance.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+                submitted += len(rows)
+                rows = []
+
+        DoseInstance.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+        submitted += len(rows)
+
+    # Advanced only once every chunk is in
+    JobWatermark.objects.update_or_create(
+        name=DOSE_JOB,
+        defaults={"value": end}
+    )
+
+    if submitted:
+        logger.info("Materialized %d dose(s) through %s", submitted, end.isoformat())
+
+    return submitted
+
+
+def mark_taken(schedule_id, day):
+    """
+    Mark the schedule's doses on ``day`` (in the patient's time zone)
+    as taken, from a PillIntake.
+    """
+    tz = zone(PillSchedule.objects.filter(
+        pk=schedule_id
+    ).values_list('patient__timezone', flat=True).first())
+
+    start = datetime.combine(day, time.min, tzinfo=tz)
+
+    return DoseInstance.objects.filter(
+        schedule_id=schedule_id,
+        due_at__gte=start,
+        due_at__lt=datetime.combine(day + timedelta(days=1), time.min, tzinfo=tz)
+    ).exclude(
+        status=DoseInstance.TAKEN
+    ).update(status=DoseInstance.TAKEN)
@@ -0,0 +1,131 @@
+import queue
+import threading
+import time
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from .metrics import Counter, Gauge, Histogram
+from .models import PillEvent
+from .projection import project_status
+
+
+INGEST_DROPPED = Counter(
+    "pillbox_status_messages_dropped_total",
+    "Status messages dropped because the ingest queue was full or a flush failed."
+)
+
+INGEST_BATCH = Histogram(
+    "pillbox_status_ingest_batch_size",
+    "Status messages written per bulk insert.",
+    buckets=(1, 10, 50, 100, 250, 500, 1000)
+)
+
+
+class StatusIngestor:
+    """
+    Buffers pillbox status messages in a bounded in-memory queue and
+    writes them with bulk_create from one writer thread, every
+    ``batch_size`` messages or ``flush_ms`` milliseconds, whichever
+    comes first. Each flushed batch is also projected into
+    PillBoxStatus (see projection.py). submit() never blocks the MQTT
+    network thread; when the queue is full the message is dropped and
+    counted.
+    """
+
+    def __init__(self, max_size=None, batch_size=None, flush_ms=None):
+        self.queue = queue.Queue(maxsize=max_size or settings.STATUS_INGEST_QUEUE_SIZE)
+        self.batch_size = batch_size or settings.STATUS_INGEST_BATCH_SIZE
+        self.flush_seconds = (flush_ms or settings.STATUS_INGEST_FLUSH_MS) / 1000
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run,
+            name="status-ingestor",
+            daemon=True
+        )
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def submit(self, topic, payload):
+        try:
+            self.queue.put_nowait((topic, payload, timezone.now()))
+            return True
+        except queue.Full:
+            INGEST_DROPPED.inc()
+            return False
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def run(self):
+        batch = []
+        deadline = None
+
+        while not (self.stopping.is_set() and self.queue.empty()):
+
+            wait = self.flush_seconds if not batch else max(deadline - time.monotonic(), 0)
+
+            try:
+                item = self.queue.get(timeout=wait)
+
+                if not batch:
+                    deadline = time.monotonic() + self.flush_seconds
+
+                batch.append(item)
+
+            except queue.Empty:
+                pass
+
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self.flush(batch)
+                batch = []
+
+        if batch:
+            self.flush(batch)
+
+        connection.close()
+
+    def flush(self, batch):
+        try:
+            PillEvent.objects.bulk_create([
+                PillEvent(topic=topic, event=payload, timestamp=received_at)
+                for topic, payload, received_at in batch
+            ])
+            INGEST_BATCH.observe(len(batch))
+
+        except Exception as e:
+            INGEST_DROPPED.inc(len(batch))
+            print("❌ INGEST ERROR:", e)
+            # Reconnect on the next flush
+            connection.close()
+
+        try:
+            project_status(batch)
+
+        except Exception as e:
+            print("❌ STATUS PROJECTION ERROR:", e)
+            connection.close()
+
+    def stop(self, timeout=10):
+        """
+        Stop accepting work, flush everything already queued and wait
+        for the writer thread.
+        """
+        self.stopping.set()
+        self.thread.join(timeout)
+
+
+_ingestors = []
+
+INGEST_QUEUE = Gauge(
+    "pillbox_status_ingest_queue_depth",
+    "Status messages waiting to be written.",
+    lambda: sum(ingestor.depth() for ingestor in _ingestors)
+)
+
+
+def start_ingestor(**kwargs):
+    ingestor = StatusIngestor(**kwargs).start()
+    _ingestors.append(ingestor)
+    return ingestor
@@ -0,0 +1,106 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from pilltracker_backend.api.models import (
+    PillIntake,
+    Alert,
+    Medication,
+    Dispense,
+    MQTTOutbox
+)
+
+
+def hot_queries():
+    """
+    (label, queryset, index expected in the plan) for each hot path.
+    """
+    now = timezone.localtime()
+    today = now.date()
+
+    return [
+        (
+            "intake taken today",
+            PillIntake.objects.filter(schedule_id=1, date=today, taken=True),
+            "intake_taken_idx",
+        ),
+        (
+            "patient alerts by type",
+            Alert.objects.filter(
+                patient_id=1,
+                alert_type="Missed Dose",
+                created_at__gte=now - timedelta(days=1)
+            ),
+            "alert_patient_type_idx",
+        ),
+        (
+            "next medication for patient",
+            Medication.objects.filter(
+                patient_id=1,
+                next_due_at__gte=now
+            ).order_by('next_due_at'),
+            "medication_patient_due_idx",
+        ),
+        (
+            "scheduler due window",
+            Medication.objects.filter(
+                next_due_at__gte=now - timedelta(hours=1),
+                next_due_at__lte=now
+            ),
+            "medication_next_due_idx",
+        ),
+        (
+            "dispatcher refresh",
+            Medication.objects.filter(updated_at__gte=now - timedelta(seconds=5)),
+            "medication_updated_idx",
+        ),
+        (
+            "dispense history",
+            Dispense.objects.filter(medication_id=1).order_by('-time_dispensed'),
+            "dispense_medication_time_idx",
+        ),
+        (
+            "outbox pending",
+            MQTTOutbox.objects.filter(
+                delivered_at__isnull=True,
+                next_attempt_at__lte=now
+            ).order_by('next_attempt_at', 'id'),
+            "outbox_pending_idx",
+        ),
+    ]
+
+
+class Command(BaseCommand):
+
+    help = "EXPLAIN the hot-path queries and fail if an expected index is not used."
+
+    def handle(self, *args, **options):
+
+        if connection.vendor not in ("sqlite", "postgresql"):
+            raise CommandError(f"Unsupported database: {connection.vendor}")
+
+        failures = []
+
+        for label, queryset, index in hot_queries():
+
+            with transaction.atomic():
+
+                # Small or empty tables make a seq scan cheaper on
+                # PostgreSQL; ask whether the index is usable at all
+                if connection.vendor == "postgresql":
+                    with connection.cursor() as cursor:
+                        cursor.execute("SET LOCAL enable_seqscan = off")
+
+                plan = queryset.explain()
+
+            if index in plan:
+                self.stdout.write(self.style.SUCCESS(f"OK    {label}: {index}"))
+            else:
+                failures.append(label)
+                self.stdout.write(self.style.ERROR(f"FAIL  {label}: expected {index}"))
+                self.stdout.write(plan)
+
+        if failures:
+            raise CommandError(f"{len(failures)} query plan(s) missed their index")
@@ -0,0 +1,103 @@
+import json
+import platform
+import subprocess
+import time
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from pilltracker_backend.api.benchmarks import generator, suite
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            stderr=subprocess.DEVNULL,
+            text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Build a throwaway database, fill it with synthetic data and time "
+        "the scheduler, alert generation and list endpoints. MQTT goes to "
+        "an in-memory publisher; no network is needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--patients", type=int, default=1000)
+        parser.add_argument("--medications-per-patient", type=int, default=5)
+        parser.add_argument("--schedules-per-patient", type=int, default=3)
+        parser.add_argument("--history-days", type=int, default=1)
+        parser.add_argument("--due-fraction", type=float, default=0.01,
+                            help="Share of medications due at generation time")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--only", nargs="*", help="Run benchmarks whose name contains any of these")
+        parser.add_argument("--output", default="bench_output.json")
+        parser.add_argument("--compare", help="Previous JSON result to compare medians against")
+
+    def handle(self, *args, **options):
+
+        verbosity = options["verbosity"]
+        old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True)
+
+        try:
+            with override_settings(
+                MQTT_PUBLISHER_CLASS='pilltracker_backend.api.mqtt_client.LocalPublisher'
+            ):
+                start = time.perf_counter()
+
+                rows = generator.generate(
+                    patients=options["patients"],
+                    medications_per_patient=options["medications_per_patient"],
+                    schedules_per_patient=options["schedules_per_patient"],
+                    history_days=options["history_days"],
+                    due_fraction=options["due_fraction"]
+                )
+
+                self.stdout.write(
+                    f"Generated {rows} in {time.perf_counter() - start:.1f}s"
+                )
+
+                results = suite.run(repeat=options["repeat"], only=options["only"])
+
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "timestamp": timezone.now().isoformat(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "rows": rows,
+            },
+            "results": results,
+        }
+
+        with open(options["output"], "w") as f:
+            json.dump(report, f, indent=2)
+
+        previous = {}
+
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                previous = json.load(f)["results"]
+
+        for name, result in results.items():
+            line = f"{name:40} {result['median_ms']:>10.2f} ms  {result['queries']:>4} queries"
+
+            if name in previous and previous[name]["median_ms"]:
+                line += f"  x{result['median_ms'] / previous[name]['median_ms']:.2f}"
+
+            self.stdout.write(line)
+
+        self.stdout.write(f"Results written to {options['output']}")
@@ -0,0 +1,101 @@
+import json
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from pilltracker_backend.api import metrics
+from pilltracker_backend.api.scheduler import Worker
+
+
+def health_server(worker, port):
+    """
+    Serve GET /health (JSON, 503 when unhealthy) and GET /metrics
+    (Prometheus text) for this process from a daemon thread.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path == "/health":
+                report = worker.health()
+                body = json.dumps(report).encode()
+                self.reply(200 if report["ok"] else 503, "application/json", body)
+
+            elif self.path == "/metrics":
+                body = metrics.render().encode()
+                self.reply(200, "text/plain; version=0.0.4; charset=utf-8", body)
+
+            else:
+                self.reply(404, "text/plain", b"Not found")
+
+        def reply(self, status, content_type, body):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Probes would flood the worker log
+            pass
+
+    server = ThreadingHTTPServer(("", port), Handler)
+    server.daemon_threads = True
+
+    threading.Thread(
+        target=server.serve_forever,
+        name="dispatcher-health",
+        daemon=True
+    ).start()
+
+    return server
+
+
+class Command(BaseCommand):
+
+    help = (
+        "Run dose dispatching, MQTT outbox delivery, alert generation and "
+        "pillbox status ingestion in this process until SIGTERM/SIGINT, "
+        "then shut down gracefully."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--health-port",
+            type=int,
+            default=settings.DISPATCHER_HEALTH_PORT,
+            help="Port for /health and /metrics (0 disables)"
+        )
+
+    def handle(self, *args, **options):
+
+        stopping = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write(f"Received {signal.Signals(signum).name}, shutting down")
+            stopping.set()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        worker = Worker().start()
+
+        server = None
+
+        if options["health_port"]:
+            server = health_server(worker, options["health_port"])
+            self.stdout.write(f"Health on :{options['health_port']}/health")
+
+        try:
+            # Signal handlers run on the main thread between waits
+            while not stopping.wait(1):
+                pass
+
+        finally:
+            if server:
+                server.shutdown()
+
+            worker.stop()
@@ -0,0 +1,250 @@
+import threading
+from bisect import bisect_left
+
+# Small in-process registry rendered in the Prometheus text format
+# (https://prometheus.io/docs/instrumenting/exposition_formats/).
+# Values are per process; scrape every process that does the work.
+
+REGISTRY = []
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metric:
+
+    kind = None
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def header(self):
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+
+class Counter(Metric):
+
+    kind = "counter"
+
+    def __init__(self, name, documentation):
+        super().__init__(name, documentation)
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def render(self):
+        return self.header() + [f"{self.name} {self.value}"]
+
+
+class Gauge(Metric):
+    """
+    Gauge read from ``function`` at scrape time.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, function):
+        super().__init__(name, documentation)
+        self.function = function
+
+    def render(self):
+        try:
+            value = self.function()
+        except Exception:
+            # A failing source must not break the whole scrape
+            return []
+        return self.header() + [f"{self.name} {value}"]
+
+
+class Histogram(Metric):
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        with self.lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self):
+        with self.lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+
+        return self.header() + histogram_lines(self.name, self.buckets, counts, total, count)
+
+
+class LabelledHistogram(Metric):
+    """
+    Histogram with one series per value of ``label``.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, label, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.label = label
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observe(self, label_value, value):
+        with self.lock:
+            series = self.series.get(label_value)
+
+            if series is None:
+                series = self.series[label_value] = [[0] * (len(self.buckets) + 1), 0, 0]
+
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        with self.lock:
+            series = {
+                label_value: (list(counts), total, count)
+                for label_value, (counts, total, count) in self.series.items()
+            }
+
+        lines = self.header()
+
+        for label_value, (counts, total, count) in sorted(series.items()):
+            lines.extend(histogram_lines(
+                self.name, self.buckets, counts, total, count,
+                labels=f'{self.label}="{label_value}",'
+            ))
+
+        return lines
+
+
+def histogram_lines(name, buckets, counts, total, count, labels=""):
+    lines = []
+    cumulative = 0
+
+    for bound, bucket in zip(buckets + ("+Inf",), counts):
+        cumulative += bucket
+        lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+
+    series = f"{{{labels.rstrip(',')}}}" if labels else ""
+
+    lines.append(f"{name}_sum{series} {total}")
+    lines.append(f"{name}_count{series} {count}")
+
+    return lines
+
+
+def render():
+    lines = []
+
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+
+    return "\n".join(lines) + "\n"
+
+
+# ----------------------------
+# API requests (RequestMetricsMiddleware, REQUEST_METRICS_ENABLED)
+# ----------------------------
+REQUEST_SECONDS = LabelledHistogram(
+    "pillbox_http_request_duration_seconds",
+    "Wall time of API requests, per URL name.",
+    "endpoint"
+)
+
+REQUEST_DB_SECONDS = LabelledHistogram(
+    "pillbox_http_request_db_seconds",
+    "Time API requests spent in database queries, per URL name.",
+    "endpoint"
+)
+
+REQUEST_SERIALIZE_SECONDS = LabelledHistogram(
+    "pillbox_http_request_serialize_seconds",
+    "Time API requests spent in serializer .data, per URL name.",
+    "endpoint"
+)
+
+REQUEST_QUERIES = LabelledHistogram(
+    "pillbox_http_request_queries",
+    "Database queries per API request, per URL name.",
+    "endpoint",
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100)
+)
+
+# ----------------------------
+# Scheduler
+# ----------------------------
+TICK_SECONDS = Histogram(
+    "pillbox_check_medications_duration_seconds",
+    "Duration of one check_medications tick."
+)
+
+DOSES_PER_TICK = Histogram(
+    "pillbox_doses_dispatched_per_tick",
+    "Doses dispatched by one check_medications tick.",
+    buckets=(0, 1, 5, 10, 50, 100, 500, 1000, 5000)
+)
+
+DOSES_DISPATCHED = Counter(
+    "pillbox_doses_dispatched_total",
+    "Doses dispatched by the scheduler."
+)
+
+DOSES_MISFIRED = Counter(
+    "pillbox_doses_misfired_total",
+    "Doses skipped because they were later than the misfire grace."
+)
+
+JOB_FAILURES = Counter(
+    "pillbox_worker_job_failures_total",
+    "Background job runs (outbox, alerts, notifications, doses) that raised."
+)
+
+# ----------------------------
+# MQTT
+# ----------------------------
+PUBLISH_SECONDS = Histogram(
+    "pillbox_mqtt_publish_latency_seconds",
+    "Time from publish to broker acknowledgement for outbox rows."
+)
+
+PUBLISH_FAILURES = Counter(
+    "pillbox_mqtt_publish_failures_total",
+    "MQTT publishes rejected by the client or not acknowledged in time."
+)
+
+STATUS_MESSAGES = Counter(
+    "pillbox_mqtt_status_messages_total",
+    "Pillbox status messages ingested."
+)
+
+# ----------------------------
+# Alerts
+# ----------------------------
+ALERTS_PER_RUN = Histogram(
+    "pillbox_alerts_created_per_run",
+    "Alerts created by one alert generation run.",
+    buckets=(0, 1, 5, 10, 50, 100, 500, 1000)
+)
+
+ALERTS_CREATED = Counter(
+    "pillbox_alerts_created_total",
+    "Alerts created by alert generation."
+)
+
+
+def observe_alerts(created):
+    ALERTS_PER_RUN.observe(created)
+    ALERTS_CREATED.inc(created)
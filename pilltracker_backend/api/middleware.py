@@ -0,0 +1,194 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .metrics import (
+    REQUEST_DB_SECONDS,
+    REQUEST_QUERIES,
+    REQUEST_SECONDS,
+    REQUEST_SERIALIZE_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the latency histogram buckets
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+
+
+class QueryTimer:
+    """
+    Database execute wrapper counting queries and their total time.
+    """
+
+    def __init__(self, sample):
+        self.sample = sample
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sample["queries"] += 1
+            self.sample["db_ms"] += (time.perf_counter() - start) * 1000
+
+
+class EndpointStats:
+    """
+    Rolling window of the last ``window`` requests for one endpoint.
+    """
+
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+
+    def add(self, sample):
+        self.samples.append(sample)
+
+    def snapshot(self):
+        samples = list(self.samples)
+        wall = sorted(s["wall_ms"] for s in samples)
+
+        def percentile(p):
+            return round(wall[min(len(wall) - 1, int(len(wall) * p))], 3) if wall else None
+
+        return {
+            "count": len(samples),
+            "buckets": {
+                str(bound): sum(1 for ms in wall if ms <= bound)
+                for bound in BUCKETS_MS
+            },
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "mean_queries": round(sum(s["queries"] for s in samples) / len(samples), 2) if samples else None,
+            "mean_db_ms": round(sum(s["db_ms"] for s in samples) / len(samples), 3) if samples else None,
+            "mean_serialize_ms": round(sum(s["serialize_ms"] for s in samples) / len(samples), 3) if samples else None,
+        }
+
+
+_endpoints = {}
+_endpoints_lock = threading.Lock()
+
+# Sample of the request being handled, for timed_serialization()
+_current_sample = ContextVar("request_metrics_sample", default=None)
+
+
+def record(endpoint, sample):
+    with _endpoints_lock:
+        stats = _endpoints.get(endpoint)
+
+        if stats is None:
+            stats = _endpoints[endpoint] = EndpointStats(settings.REQUEST_METRICS_WINDOW)
+
+        stats.add(sample)
+
+    # Cumulative, for /api/metrics/
+    REQUEST_SECONDS.observe(endpoint, sample["wall_ms"] / 1000)
+    REQUEST_DB_SECONDS.observe(endpoint, sample["db_ms"] / 1000)
+    REQUEST_SERIALIZE_SECONDS.observe(endpoint, sample["serialize_ms"] / 1000)
+    REQUEST_QUERIES.observe(endpoint, sample["queries"])
+
+
+@contextmanager
+def timed_serialization():
+    """
+    Add the time spent in the block to the current request's
+    ``serialize_ms``. Does nothing outside a measured request.
+    """
+    sample = _current_sample.get()
+
+    if sample is None:
+        yield
+        return
+
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        sample["serialize_ms"] += (time.perf_counter() - start) * 1000
+
+
+def endpoint_stats():
+    """
+    Histogram snapshot per URL name for this process. The same
+    measurements are exported cumulatively on /api/metrics/.
+    """
+    with _endpoints_lock:
+        endpoints = list(_endpoints.items())
+
+    return {name: stats.snapshot() for name, stats in endpoints}
+
+
+class RequestMetricsMiddleware:
+    """
+    Per-request query count, DB time, serializer time, JSON rendering
+    time and wall time, tagged with the resolved URL name. Serializer
+    time (``serialize_ms``) is the time spent in ``.data`` of the
+    serializers in serializers.py, timed through timed_serialization().
+    It happens in the view, before rendering, so it is not part of
+    ``json_render_ms``. Each request is logged as one JSON line and
+    added to the endpoint's rolling and exported histograms.
+    Enabled with REQUEST_METRICS_ENABLED.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sample = {"queries": 0, "db_ms": 0.0, "serialize_ms": 0.0, "json_render_ms": 0.0}
+        request._metrics_sample = sample
+
+        start = time.perf_counter()
+
+        token = _current_sample.set(sample)
+
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(QueryTimer(sample)))
+
+                response = self.get_response(request)
+        finally:
+            _current_sample.reset(token)
+
+        sample["wall_ms"] = (time.perf_counter() - start) * 1000
+
+        match = request.resolver_match
+        endpoint = match.url_name if match and match.url_name else "unresolved"
+
+        record(endpoint, sample)
+
+        logger.info(json.dumps({
+            "endpoint": endpoint,
+            "method": request.method,
+            "status": response.status_code,
+            "queries": sample["queries"],
+            "db_ms": round(sample["db_ms"], 3),
+            "serialize_ms": round(sample["serialize_ms"], 3),
+            "json_render_ms": round(sample["json_render_ms"], 3),
+            "wall_ms": round(sample["wall_ms"], 3),
+        }))
+
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered to JSON bytes after this hook
+        start = time.perf_counter()
+
+        def rendered(response):
+            request._metrics_sample["json_render_ms"] += (time.perf_counter() - start) * 1000
+
+        response.add_post_render_callback(rendered)
+
+        return response
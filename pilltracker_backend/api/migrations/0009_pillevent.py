@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_medication_created_at_medication_end_date_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PillEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.TextField()),
+                ('timestamp', models.DateTimeField()),
+            ],
+        ),
+    ]
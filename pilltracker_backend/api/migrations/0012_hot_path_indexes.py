@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_jobwatermark'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['patient', 'alert_type', 'created_at'], name='alert_patient_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dispense',
+            index=models.Index(fields=['medication', 'time_dispensed'], name='dispense_medication_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pillintake',
+            index=models.Index(condition=models.Q(('taken', True)), fields=['schedule', 'date'], name='intake_taken_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['created_at', 'id'], name='alert_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='refilllog',
+            index=models.Index(fields=['timestamp', 'id'], name='refilllog_timestamp_idx'),
+        ),
+    ]
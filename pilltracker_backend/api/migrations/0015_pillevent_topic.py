@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_pillbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pillevent',
+            name='topic',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_pillevent_topic'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medication',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='medication',
+            index=models.Index(fields=['updated_at'], name='medication_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:39
+
+from calendar import monthrange
+from datetime import date, datetime, time, timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+# Frozen copy of recurrence.next_occurrence as of this migration, in
+# the server time zone (patients had no time zone yet), so later
+# changes to the live scheduling code cannot change what it computes.
+def next_occurrence(med, after):
+    tz = timezone.get_default_timezone()
+    start_date = med.start_date
+    day = max(timezone.localtime(after, tz).date(), start_date)
+
+    while not med.end_date or day <= med.end_date:
+
+        if med.frequency == 'Monthly':
+            candidate = date(
+                day.year,
+                day.month,
+                min(start_date.day, monthrange(day.year, day.month)[1])
+            )
+
+            if candidate < day:
+                # Already past this month's date: first of next month
+                day = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+                continue
+
+            day = candidate
+
+        elif med.frequency == 'Weekly':
+            day += timedelta(days=(start_date.weekday() - day.weekday()) % 7)
+
+        if med.end_date and day > med.end_date:
+            return None
+
+        instant = datetime.combine(day, med.time, tzinfo=tz)
+
+        if instant > after:
+            return instant
+
+        day += timedelta(days=1)
+
+    return None
+
+
+def schedule_existing(apps, schema_editor):
+    Medication = apps.get_model('api', 'Medication')
+
+    now = timezone.now()
+
+    medications = list(Medication.objects.all())
+
+    for med in medications:
+        after = now
+
+        if med.last_dispensed_date:
+            after = max(after, timezone.make_aware(
+                datetime.combine(med.last_dispensed_date, time.max)
+            ))
+
+        med.next_due_at = next_occurrence(med, after)
+
+    Medication.objects.bulk_update(medications, ['next_due_at'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_medication_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medication',
+            name='next_due_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='medication',
+            index=models.Index(fields=['next_due_at'], name='medication_next_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medication',
+            index=models.Index(fields=['patient', 'next_due_at'], name='medication_patient_due_idx'),
+        ),
+        migrations.RunPython(schedule_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_medication_next_due_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoseInstance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('due_at', models.DateTimeField()),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Dispensed', 'Dispensed'), ('Taken', 'Taken'), ('Missed', 'Missed')], default='Pending', max_length=20)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('medication', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='doses', to='api.medication')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='doses', to='api.patient')),
+                ('schedule', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='doses', to='api.pillschedule')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient', 'due_at'], name='dose_patient_due_idx'), models.Index(condition=models.Q(('status', 'Pending')), fields=['due_at'], name='dose_pending_due_idx')],
+                'constraints': [models.UniqueConstraint(fields=('medication', 'due_at'), name='dose_medication_due_uniq'), models.UniqueConstraint(fields=('schedule', 'due_at'), name='dose_schedule_due_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:43
+
+import pilltracker_backend.api.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_doseinstance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='timezone',
+            field=models.CharField(default='Asia/Kolkata', max_length=64, validators=[pilltracker_backend.api.models.validate_timezone]),
+        ),
+    ]
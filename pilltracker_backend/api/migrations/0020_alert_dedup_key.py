@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_patient_timezone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alert',
+            name='dedup_key',
+            field=models.CharField(blank=True, max_length=150, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='alert',
+            constraint=models.UniqueConstraint(fields=('dedup_key',), name='alert_dedup_uniq'),
+        ),
+    ]
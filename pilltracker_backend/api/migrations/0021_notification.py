@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:44
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_alert_dedup_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipient', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Sent', 'Sent'), ('Failed', 'Failed')], default='Pending', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('alert', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='api.alert')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('status', 'Pending')), fields=['next_attempt_at', 'id'], name='notification_pending_idx')],
+                'constraints': [models.UniqueConstraint(fields=('alert', 'recipient'), name='notification_alert_recipient_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:54
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_notification'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pillbox',
+            name='device_id',
+            field=models.CharField(max_length=64, unique=True, validators=[django.core.validators.RegexValidator('^[A-Za-z0-9_-]+$', "Device ID may only contain letters, digits, '_' and '-'.")]),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_pillbox_device_id_validator'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pillboxstatus',
+            name='reported_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
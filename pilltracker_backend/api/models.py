@@ -1,5 +1,23 @@
+from functools import lru_cache
+from zoneinfo import available_timezones
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import RegexValidator
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+
+@lru_cache(maxsize=None)
+def timezone_names():
+    # available_timezones() walks the tz database on every call
+    return frozenset(available_timezones())
+
+
+def validate_timezone(value):
+    if value not in timezone_names():
+        raise ValidationError(f"Unknown time zone: {value}")
 
 
 # -----------------------------
@@ -54,6 +72,23 @@ class Patient(models.Model):
         null=True
     )
 
+    # IANA name; medication times are wall-clock times in this zone
+    timezone = models.CharField(
+        max_length=64,
+        default=settings.TIME_ZONE,
+        validators=[validate_timezone]
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+
+        # Lets signals.py tell whether a save changed the time zone
+        if 'timezone' in field_names:
+            instance._loaded_timezone = values[field_names.index('timezone')]
+
+        return instance
+
     def __str__(self):
         return self.name
 
@@ -108,6 +143,16 @@ class PillIntake(models.Model):
         null=True
     )
 
+    class Meta:
+        indexes = [
+            # "Taken on this day?" lookups (alerts, adherence)
+            models.Index(
+                fields=['schedule', 'date'],
+                condition=models.Q(taken=True),
+                name='intake_taken_idx'
+            ),
+        ]
+
     def __str__(self):
         return f"{self.schedule.pill_name} - {self.date}"
 
@@ -129,10 +174,47 @@ class PillBoxStatus(models.Model):
 
     last_updated = models.DateTimeField(auto_now=True)
 
+    # When the newest report folded in here was received; older reports
+    # arriving late are ignored (see projection.py)
+    reported_at = models.DateTimeField(
+        null=True,
+        blank=True
+    )
+
     def __str__(self):
         return f"Pill Box for {self.patient.name}"
 
 
+# -----------------------------
+# Pill Box Device Registry
+# -----------------------------
+class PillBox(models.Model):
+
+    # Hardware ID; MQTT topics are pillbox/<device_id>/<kind>, so no
+    # "/", "+" or "#"
+    device_id = models.CharField(
+        max_length=64,
+        unique=True,
+        validators=[RegexValidator(
+            r'^[A-Za-z0-9_-]+$',
+            "Device ID may only contain letters, digits, '_' and '-'."
+        )]
+    )
+
+    patient = models.OneToOneField(
+        Patient,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='pillbox'
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"PillBox {self.device_id}"
+
+
 # -----------------------------
 # Alerts
 # -----------------------------
@@ -152,10 +234,102 @@ class Alert(models.Model):
 
     is_resolved = models.BooleanField(default=False)
 
+    # e.g. "Missed Dose:schedule:12:2030-01-31"; None for ad-hoc alerts
+    dedup_key = models.CharField(
+        max_length=150,
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        constraints = [
+            # One alert per key, enforced by the index
+            models.UniqueConstraint(
+                fields=['dedup_key'],
+                name='alert_dedup_uniq'
+            ),
+        ]
+        indexes = [
+            # Per-patient alert lookups / duplicate checks
+            models.Index(
+                fields=['patient', 'alert_type', 'created_at'],
+                name='alert_patient_type_idx'
+            ),
+            # Cursor pagination of the alert list
+            models.Index(
+                fields=['created_at', 'id'],
+                name='alert_created_idx'
+            ),
+        ]
+
     def __str__(self):
         return f"{self.alert_type} - {self.patient.name}"
 
 
+# -----------------------------
+# Alert Notifications
+# -----------------------------
+class Notification(models.Model):
+
+    PENDING = 'Pending'
+    SENT = 'Sent'
+    FAILED = 'Failed'
+
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    alert = models.ForeignKey(
+        Alert,
+        on_delete=models.CASCADE,
+        related_name='notifications'
+    )
+
+    # Address understood by the configured backend (e.g. an email)
+    recipient = models.CharField(max_length=255)
+
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=PENDING
+    )
+
+    attempts = models.IntegerField(default=0)
+
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+
+    sent_at = models.DateTimeField(
+        null=True,
+        blank=True
+    )
+
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # Fan-out is idempotent
+            models.UniqueConstraint(
+                fields=['alert', 'recipient'],
+                name='notification_alert_recipient_uniq'
+            ),
+        ]
+        indexes = [
+            # Sender scans pending rows only
+            models.Index(
+                fields=['next_attempt_at', 'id'],
+                condition=models.Q(status='Pending'),
+                name='notification_pending_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.recipient} #{self.alert_id} ({self.status})"
+
+
 # -----------------------------
 # Refill Logs
 # -----------------------------
@@ -169,6 +343,15 @@ class RefillLog(models.Model):
 
     refill_needed = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Cursor pagination of the refill log
+            models.Index(
+                fields=['timestamp', 'id'],
+                name='refilllog_timestamp_idx'
+            ),
+        ]
+
     def __str__(self):
         return f"{self.pill_name} - {self.count}"
 
@@ -239,6 +422,49 @@ class Medication(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Next occurrence (UTC) in the patient's time zone per recurrence.py;
+    # None once end_date has passed. Set on save (signals.py) and
+    # advanced by the dispatcher.
+    next_due_at = models.DateTimeField(
+        null=True,
+        blank=True
+    )
+
+    # Dispatcher refreshes rows changed since its last pass
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Scheduler due-window lookup
+            models.Index(
+                fields=['next_due_at'],
+                name='medication_next_due_idx'
+            ),
+            # Next medication for a patient
+            models.Index(
+                fields=['patient', 'next_due_at'],
+                name='medication_patient_due_idx'
+            ),
+            # Dispatcher refresh: rows changed since its last pass
+            models.Index(
+                fields=['updated_at'],
+                name='medication_updated_idx'
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+
+        # Lets signals.py tell whether a save changed the schedule
+        instance._loaded_values = {
+            name: value
+            for name, value in zip(field_names, values)
+            if value is not models.DEFERRED
+        }
+
+        return instance
+
     def __str__(self):
         return f"{self.name} ({self.patient.name})"
 
@@ -265,5 +491,164 @@ class Dispense(models.Model):
         default='Dispensed'
     )
 
+    class Meta:
+        indexes = [
+            # Dispense history per medication, newest first
+            models.Index(
+                fields=['medication', 'time_dispensed'],
+                name='dispense_medication_time_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.pill_name} - Compartment {self.compartment}"
+
+
+# -----------------------------
+# Dose Instances
+# -----------------------------
+class DoseInstance(models.Model):
+
+    PENDING = 'Pending'
+    DISPENSED = 'Dispensed'
+    TAKEN = 'Taken'
+    MISSED = 'Missed'
+
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (DISPENSED, 'Dispensed'),
+        (TAKEN, 'Taken'),
+        (MISSED, 'Missed'),
+    ]
+
+    patient = models.ForeignKey(
+        Patient,
+        on_delete=models.CASCADE,
+        related_name='doses'
+    )
+
+    # One occurrence of either a Medication or a PillSchedule
+    medication = models.ForeignKey(
+        Medication,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='doses'
+    )
+
+    schedule = models.ForeignKey(
+        PillSchedule,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='doses'
+    )
+
+    name = models.CharField(max_length=100)
+
+    due_at = models.DateTimeField()
+
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=PENDING
+    )
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Per-patient history / adherence
+            models.Index(
+                fields=['patient', 'due_at'],
+                name='dose_patient_due_idx'
+            ),
+            # Missed-dose sweep over pending rows
+            models.Index(
+                fields=['due_at'],
+                condition=models.Q(status='Pending'),
+                name='dose_pending_due_idx'
+            ),
+        ]
+        constraints = [
+            # Materialization is idempotent
+            models.UniqueConstraint(
+                fields=['medication', 'due_at'],
+                name='dose_medication_due_uniq'
+            ),
+            models.UniqueConstraint(
+                fields=['schedule', 'due_at'],
+                name='dose_schedule_due_uniq'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} @ {self.due_at} ({self.status})"
+
+
+# -----------------------------
+# Pillbox Events (MQTT)
+# -----------------------------
+class PillEvent(models.Model):
+
+    topic = models.CharField(max_length=255, blank=True)
+
+    event = models.TextField()
+
+    timestamp = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.timestamp} - {self.event[:50]}"
+
+
+# -----------------------------
+# MQTT Outbox
+# -----------------------------
+class MQTTOutbox(models.Model):
+
+    topic = models.CharField(max_length=255)
+
+    payload = models.JSONField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    attempts = models.IntegerField(default=0)
+
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+
+    delivered_at = models.DateTimeField(
+        null=True,
+        blank=True
+    )
+
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # Drainer scans undelivered rows only
+            models.Index(
+                fields=['next_attempt_at', 'id'],
+                condition=models.Q(delivered_at__isnull=True),
+                name='outbox_pending_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} #{self.id}"
+
+
+# -----------------------------
+# Background Job Watermarks
+# -----------------------------
+class JobWatermark(models.Model):
+
+    # e.g. "missed-dose-alerts"
+    name = models.CharField(max_length=100, unique=True)
+
+    # Everything before this instant has been processed
+    value = models.DateTimeField()
+
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
-        return f"{self.pill_name} - Compartment {self.compartment}"
\ No newline at end of file
+        return f"{self.name} @ {self.value}"
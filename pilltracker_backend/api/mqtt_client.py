@@ -1,34 +1,281 @@
 import json
+import os
+import threading
 import paho.mqtt.client as mqtt
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from django.utils import timezone
-from .models import PillEvent
+from django.utils.module_loading import import_string
+from .ingestion import start_ingestor
+from .metrics import Gauge, PUBLISH_FAILURES, STATUS_MESSAGES
+from .models import PillEvent, PillBox
 
-BROKER = "broker.hivemq.com"
-PORT = 1883
+BROKER = settings.MQTT_BROKER_HOST
+PORT = settings.MQTT_BROKER_PORT
+KEEPALIVE = settings.MQTT_KEEPALIVE
 TOPIC_CMD = "pill_dispenser/cmd"
+
+# Shared topics, still used for boxes not in the PillBox registry
 TOPIC_STATUS = "pillbox/status"
 TOPIC_SCHEDULE = "pillbox/schedule"
+TOPIC_DISPENSE = "pillbox/dispense"
+
+# Per-device status reports
+TOPIC_DEVICE_STATUS = "pillbox/+/status"
+
+
+# ---------- TOPIC ROUTING ----------
+def device_topic(device_id, kind):
+    """
+    pillbox/<device_id>/<kind> for a registered box, otherwise the
+    shared pillbox/<kind> topic.
+    """
+    if device_id:
+        return f"pillbox/{device_id}/{kind}"
+    return f"pillbox/{kind}"
+
+
+def patient_topic(patient_id, kind):
+    device_id = None
+
+    if patient_id:
+        device_id = PillBox.objects.filter(
+            patient_id=patient_id
+        ).values_list('device_id', flat=True).first()
+
+    return device_topic(device_id, kind)
+
+
+class UnknownDevice(Exception):
+    pass
+
+
+def box_topic(device_id, patient_id, kind):
+    """
+    Topic for one box: the registered box ``device_id`` names, else the
+    box of patient ``patient_id``. Only a call naming neither (legacy
+    clients) gets the shared topic. Raises UnknownDevice for an
+    unregistered device ID, or a patient that is not a valid ID or has
+    no registered box, rather than building a topic from client input or
+    falling back to every box.
+    """
+    if device_id:
+        if not PillBox.objects.filter(device_id=device_id).exists():
+            raise UnknownDevice(f"Unknown device: {device_id}")
+
+        return device_topic(device_id, kind)
+
+    if patient_id in (None, ""):
+        return device_topic(None, kind)
+
+    try:
+        patient_id = int(patient_id)
+    except (TypeError, ValueError):
+        raise UnknownDevice(f"Invalid patient: {patient_id}")
+
+    device_id = PillBox.objects.filter(
+        patient_id=patient_id
+    ).values_list('device_id', flat=True).first()
+
+    if not device_id:
+        raise UnknownDevice(f"No pillbox registered for patient {patient_id}")
+
+    return device_topic(device_id, kind)
+
+
+class PublishQueueFull(Exception):
+    pass
+
+
+# ---------- SHARED PUBLISHER ----------
+class MQTTPublisher:
+    """
+    Long-lived MQTT connection shared by every caller in a process.
+
+    paho runs the network loop in a background thread and reconnects on
+    its own. publish() only appends to the client's outgoing queue, which
+    is bounded by MQTT_MAX_QUEUED_MESSAGES and survives reconnects
+    (messages are sent with QoS 1).
+    """
+
+    def __init__(self, host=BROKER, port=PORT, keepalive=KEEPALIVE,
+                 max_queued=settings.MQTT_MAX_QUEUED_MESSAGES):
+        self.client = mqtt.Client()
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.max_queued_messages_set(max_queued)
+        self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+        self.client.connect_async(host, port, keepalive)
+        self.client.loop_start()
+
+    def _on_connect(self, client, userdata, flags, rc):
+        print("✅ MQTT publisher connected:", mqtt.connack_string(rc))
+
+    def _on_disconnect(self, client, userdata, rc):
+        if rc != mqtt.MQTT_ERR_SUCCESS:
+            print("⚠️ MQTT publisher disconnected, reconnecting:", rc)
+
+    def is_connected(self):
+        return self.client.is_connected()
+
+    def queue_depth(self):
+        # QoS 1 messages not yet acknowledged by the broker
+        return len(self.client._out_messages)
+
+    def publish(self, topic, payload):
+        if not isinstance(payload, (str, bytes)):
+            payload = json.dumps(payload)
+
+        info = self.client.publish(topic, payload, qos=1)
+
+        if info.rc == mqtt.MQTT_ERR_QUEUE_SIZE:
+            PUBLISH_FAILURES.inc()
+            raise PublishQueueFull(f"MQTT outgoing queue full, dropped {topic}")
+
+        # NO_CONN means the message is queued and sent when the loop
+        # reconnects, but paho's MessageInfo then raises from
+        # wait_for_publish()/is_published(); report it as queued so the
+        # caller can wait for the ack like any other message
+        if info.rc == mqtt.MQTT_ERR_NO_CONN:
+            info.rc = mqtt.MQTT_ERR_SUCCESS
+
+        elif info.rc != mqtt.MQTT_ERR_SUCCESS:
+            PUBLISH_FAILURES.inc()
+            raise RuntimeError(mqtt.error_string(info.rc))
+
+        return info
+
+    def stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+class LocalMessageInfo:
+
+    rc = mqtt.MQTT_ERR_SUCCESS
+
+    def wait_for_publish(self, timeout=None):
+        pass
+
+    def is_published(self):
+        return True
+
+
+class LocalPublisher:
+    """
+    Network-free stand-in for MQTTPublisher used by tests and benchmarks.
+    Published messages are kept in ``messages`` as (topic, payload).
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    def is_connected(self):
+        return True
+
+    def queue_depth(self):
+        return 0
+
+    def publish(self, topic, payload):
+        if not isinstance(payload, (str, bytes)):
+            payload = json.dumps(payload)
+
+        self.messages.append((topic, payload))
+
+        return LocalMessageInfo()
+
+    def stop(self):
+        pass
+
+
+_publisher = None
+_publisher_pid = None
+_publisher_lock = threading.Lock()
+
+
+def get_publisher():
+    """
+    Return this process's publisher, creating it on first use. A forked
+    worker (gunicorn) gets its own connection instead of the parent's.
+    """
+    global _publisher, _publisher_pid
+
+    if _publisher is not None and _publisher_pid == os.getpid():
+        return _publisher
+
+    with _publisher_lock:
+        if _publisher is None or _publisher_pid != os.getpid():
+            _publisher = import_string(settings.MQTT_PUBLISHER_CLASS)()
+            _publisher_pid = os.getpid()
+
+    return _publisher
+
+
+PUBLISHER_QUEUE = Gauge(
+    "pillbox_mqtt_publisher_queue_depth",
+    "Messages waiting in this process's MQTT publisher.",
+    lambda: _publisher.queue_depth() if _publisher is not None else 0
+)
+
+
+@receiver(setting_changed)
+def reset_publisher(setting, **kwargs):
+    global _publisher
+
+    if setting == 'MQTT_PUBLISHER_CLASS':
+        _publisher = None
+
 
 # ---------- MQTT CALLBACKS ----------
+def subscription(topic):
+    """
+    ``topic`` as a shared subscription when MQTT_SHARED_SUBSCRIPTION_GROUP
+    is set: the broker hands each message to one subscriber of the group
+    instead of every dispatcher process. Messages keep their plain topic.
+    """
+    group = settings.MQTT_SHARED_SUBSCRIPTION_GROUP
+
+    return f"$share/{group}/{topic}" if group else topic
+
 def on_connect(client, userdata, flags, rc):
     print("✅ Connected to MQTT broker:", BROKER)
-    client.subscribe(TOPIC_STATUS)
+    client.subscribe([
+        (subscription(TOPIC_STATUS), 0),
+        (subscription(TOPIC_DEVICE_STATUS), 0),
+    ])
 
 def on_message(client, userdata, msg):
-    payload = msg.payload.decode()
-    print(f"📩 Message on {msg.topic}: {payload}")
-    PillEvent.objects.create(event=payload, timestamp=timezone.now())
+    # Runs on paho's network thread: only hand off to the ingestor
+    STATUS_MESSAGES.inc()
+    userdata.submit(msg.topic, msg.payload.decode(errors="replace"))
 
 # ---------- START BACKGROUND LISTENER ----------
-def start_mqtt():
-    client = mqtt.Client()
-    client.on_connect = on_connect
-    client.on_message = on_message
-    client.connect(BROKER, PORT, 60)
-    client.loop_start()
-    return client
+class StatusListener:
+    """
+    Subscribes to pillbox status topics and feeds a StatusIngestor.
+    """
+
+    def __init__(self, ingestor):
+        self.ingestor = ingestor
+        self.client = mqtt.Client(userdata=ingestor)
+        self.client.on_connect = on_connect
+        self.client.on_message = on_message
+        self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+
+    def start(self):
+        self.client.connect_async(BROKER, PORT, KEEPALIVE)
+        self.client.loop_start()
+        return self
 
-mqtt_client = start_mqtt()
+    def stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+        # Flush what was already received
+        self.ingestor.stop()
+
+def start_mqtt():
+    return StatusListener(start_ingestor()).start()
 
 # ---------- PUBLISH FUNCTION ----------
 def publish_schedule(time_str, motor, dose):
@@ -36,6 +283,6 @@ def publish_schedule(time_str, motor, dose):
     Publish schedule in format HH:MM,Mx,D → pillbox/schedule
     """
     message = f"{time_str},M{motor},{dose}"
-    mqtt_client.publish(TOPIC_SCHEDULE, message)
+    get_publisher().publish(TOPIC_SCHEDULE, message)
     print(f"📡 MQTT → {TOPIC_SCHEDULE}: {message}")
     PillEvent.objects.create(event=f"Schedule sent: {message}", timestamp=timezone.now())
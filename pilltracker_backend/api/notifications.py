@@ -0,0 +1,256 @@
+import json
+import threading
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .metrics import Counter, Gauge
+from .models import Alert, JobWatermark, Notification
+from .utils import reserve_writes
+
+NOTIFY_JOB = "alert-notifications"
+
+NOTIFICATIONS_SENT = Counter(
+    "pillbox_notification_batches_sent_total",
+    "Notification batches (one per recipient per run) sent."
+)
+
+NOTIFICATION_FAILURES = Counter(
+    "pillbox_notification_send_failures_total",
+    "Notification batches the backend failed to send."
+)
+
+NOTIFICATIONS_PENDING = Gauge(
+    "pillbox_notifications_pending",
+    "Alert notifications not yet sent.",
+    lambda: Notification.objects.filter(status=Notification.PENDING).count()
+)
+
+
+# ---------- BACKENDS ----------
+class ConsoleBackend:
+    """
+    Prints each batch; the default, and useful in development.
+    """
+
+    def send(self, recipient, alerts):
+        print(f"🔔 {len(alerts)} alert(s) for {recipient}:")
+        for alert in alerts:
+            print(f"   - [{alert.alert_type}] {alert.message}")
+
+
+class FileBackend:
+    """
+    Appends each batch as one JSON line to NOTIFICATION_FILE_PATH.
+    """
+
+    lock = threading.Lock()
+
+    def send(self, recipient, alerts):
+        line = json.dumps({
+            "recipient": recipient,
+            "sent_at": timezone.now().isoformat(),
+            "alerts": [
+                {
+                    "id": alert.pk,
+                    "patient": alert.patient_id,
+                    "type": alert.alert_type,
+                    "message": alert.message,
+                    "created_at": alert.created_at.isoformat(),
+                }
+                for alert in alerts
+            ],
+        })
+
+        with self.lock, open(settings.NOTIFICATION_FILE_PATH, "a") as f:
+            f.write(line + "\n")
+
+
+class EmailBackend:
+    """
+    One email per batch through Django's configured email backend.
+    """
+
+    def send(self, recipient, alerts):
+        send_mail(
+            subject=f"Smart Pillbox: {len(alerts)} new alert(s)",
+            message="\n".join(
+                f"[{alert.alert_type}] {alert.message}"
+                for alert in alerts
+            ),
+            from_email=None,
+            recipient_list=[recipient]
+        )
+
+
+def get_backend():
+    return import_string(settings.NOTIFICATION_BACKEND)()
+
+
+# ---------- FAN-OUT ----------
+def recipients_for(doctor_email):
+    recipients = set(settings.NOTIFICATION_RECIPIENTS)
+
+    if doctor_email:
+        recipients.add(doctor_email)
+
+    return recipients
+
+
+def fan_out_alerts():
+    """
+    Create one pending Notification per recipient (the patient's doctor
+    plus NOTIFICATION_RECIPIENTS) for alerts raised since the last run.
+    The window overlaps the previous one so alerts committed late are
+    not missed; the unique (alert, recipient) index drops repeats.
+    Returns the number of rows submitted.
+    """
+    now = timezone.now()
+
+    watermark = JobWatermark.objects.filter(name=NOTIFY_JOB).first()
+
+    # First run: only the last day, not the whole alert history
+    since = (
+        watermark.value - timedelta(seconds=settings.NOTIFICATION_SECONDS)
+        if watermark
+        else now - timedelta(days=1)
+    )
+
+    alerts = Alert.objects.filter(
+        created_at__gte=since,
+        is_resolved=False
+    )
+
+    rows = [
+        Notification(alert_id=alert_id, recipient=recipient)
+        for alert_id, doctor_email in alerts.values_list(
+            'pk', 'patient__doctor__user__email'
+        )
+        for recipient in recipients_for(doctor_email)
+    ]
+
+    with transaction.atomic():
+        Notification.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+
+        JobWatermark.objects.update_or_create(
+            name=NOTIFY_JOB,
+            defaults={"value": now}
+        )
+
+    return len(rows)
+
+
+# ---------- SENDER ----------
+def backoff(attempts):
+    return min(2 ** attempts * settings.NOTIFICATION_SECONDS, settings.NOTIFICATION_MAX_BACKOFF)
+
+
+def claim_batches(now):
+    """
+    Claim the pending notifications of up to
+    NOTIFICATION_MAX_SENDS_PER_RUN recipients, grouped per recipient.
+    The claim is a lease: next_attempt_at moves NOTIFICATION_LEASE_SECONDS
+    ahead, so other senders skip the rows and a sender that dies before
+    recording the outcome has them retried. Commits before returning.
+    """
+    pending_rows = Notification.objects.filter(
+        status=Notification.PENDING,
+        next_attempt_at__lte=now
+    ).select_related('alert').order_by('next_attempt_at', 'id')
+
+    # Concurrent senders take disjoint rows: SKIP LOCKED where rows can
+    # be locked, the SQLite write lock elsewhere
+    if connection.features.has_select_for_update_skip_locked:
+        pending_rows = pending_rows.select_for_update(skip_locked=True, of=('self',))
+
+    by_recipient = defaultdict(list)
+
+    with transaction.atomic():
+
+        reserve_writes(Notification)
+
+        for row in pending_rows[:settings.NOTIFICATION_BATCH_SIZE]:
+            # Rate limit: recipients beyond the cap stay pending
+            if row.recipient in by_recipient or len(by_recipient) < settings.NOTIFICATION_MAX_SENDS_PER_RUN:
+                by_recipient[row.recipient].append(row)
+
+        Notification.objects.filter(
+            pk__in=[row.pk for rows in by_recipient.values() for row in rows]
+        ).update(
+            next_attempt_at=now + timedelta(seconds=settings.NOTIFICATION_LEASE_SECONDS)
+        )
+
+    return by_recipient
+
+
+def record_failure(rows, error, now):
+    by_attempts = defaultdict(list)
+
+    for row in rows:
+        by_attempts[row.attempts + 1].append(row.pk)
+
+    for attempts, pks in by_attempts.items():
+        Notification.objects.filter(pk__in=pks).update(
+            attempts=attempts,
+            status=(
+                Notification.FAILED
+                if attempts >= settings.NOTIFICATION_MAX_ATTEMPTS
+                else Notification.PENDING
+            ),
+            next_attempt_at=now + timedelta(seconds=backoff(attempts)),
+            last_error=error
+        )
+
+
+def send_notifications(backend=None):
+    """
+    Send pending notifications grouped per recipient: one backend call
+    carries all of a recipient's alerts. At most
+    NOTIFICATION_MAX_SENDS_PER_RUN recipients are served per run; the
+    rest wait for the next run. Rows are claimed first (see
+    claim_batches) and sent outside any transaction, each batch marked
+    Sent as soon as it went out. Failed batches are retried with
+    exponential backoff and marked Failed after
+    NOTIFICATION_MAX_ATTEMPTS. Returns the number of batches sent.
+    """
+    backend = backend or get_backend()
+
+    now = timezone.now()
+
+    batches = 0
+    failed = 0
+
+    for recipient, rows in claim_batches(now).items():
+        try:
+            backend.send(recipient, [row.alert for row in rows])
+
+        except Exception as e:
+            NOTIFICATION_FAILURES.inc()
+            failed += 1
+            record_failure(rows, str(e), now)
+            continue
+
+        Notification.objects.filter(pk__in=[row.pk for row in rows]).update(
+            status=Notification.SENT,
+            sent_at=timezone.now()
+        )
+
+        batches += 1
+        NOTIFICATIONS_SENT.inc()
+
+    if failed:
+        print(f"NOTIFICATIONS: {failed} batch(es) failed, will be retried")
+
+    return batches
+
+
+def run_notification_job():
+    """
+    Periodic job: fan out new alerts, then send one round of batches.
+    """
+    fan_out_alerts()
+
+    return send_notifications()
@@ -0,0 +1,167 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from .metrics import Gauge, PUBLISH_FAILURES, PUBLISH_SECONDS
+from .models import MQTTOutbox
+from .mqtt_client import get_publisher
+from .utils import reserve_writes
+
+
+OUTBOX_PENDING = Gauge(
+    "pillbox_mqtt_outbox_pending",
+    "Outbox rows not yet delivered to the broker.",
+    lambda: MQTTOutbox.objects.filter(delivered_at__isnull=True).count()
+)
+
+# Outbox rows whose message the publisher still holds (queued while
+# disconnected, or not yet acknowledged), keyed by row id. Publishing
+# them again would send a duplicate once paho flushes its queue, so
+# later drains only check whether the broker has acknowledged them.
+_in_flight = {}
+
+
+def enqueue(topic, payload):
+    """
+    Record an MQTT command for delivery. Call inside the transaction
+    that makes the matching database change so both commit together.
+    """
+    return MQTTOutbox.objects.create(topic=topic, payload=payload)
+
+
+def enqueue_many(messages):
+    """
+    Bulk variant of :func:`enqueue` for (topic, payload) pairs.
+    """
+    return MQTTOutbox.objects.bulk_create([
+        MQTTOutbox(topic=topic, payload=payload)
+        for topic, payload in messages
+    ])
+
+
+def backoff(attempts):
+    return min(2 ** attempts, settings.MQTT_OUTBOX_MAX_BACKOFF)
+
+
+def drain_outbox(batch_size=None):
+    """
+    Publish one batch of pending outbox rows and mark the acknowledged
+    ones delivered. Rows the broker did not acknowledge are retried with
+    exponential backoff. Returns the number of rows delivered.
+
+    The batch is claimed first: its rows get a lease of
+    MQTT_OUTBOX_LEASE_SECONDS (next_attempt_at moves ahead) and the claim
+    commits before anything is published. Concurrent drainers, e.g. one
+    per run_dispatcher process, therefore never publish the same row,
+    and rows of a drainer that died mid-batch are retried once the lease
+    runs out.
+    """
+    publisher = get_publisher()
+
+    # Leave rows pending rather than piling them into paho's queue
+    if not publisher.is_connected():
+        return 0
+
+    now = timezone.now()
+
+    pending_rows = MQTTOutbox.objects.filter(
+        delivered_at__isnull=True,
+        next_attempt_at__lte=now
+    ).order_by('next_attempt_at', 'id')
+
+    # Concurrent drainers take disjoint batches: SKIP LOCKED where rows
+    # can be locked, the SQLite write lock elsewhere
+    if connection.features.has_select_for_update_skip_locked:
+        pending_rows = pending_rows.select_for_update(skip_locked=True)
+
+    with transaction.atomic():
+
+        reserve_writes(MQTTOutbox)
+
+        rows = list(pending_rows[:batch_size or settings.MQTT_OUTBOX_BATCH_SIZE])
+
+        MQTTOutbox.objects.filter(pk__in=[row.pk for row in rows]).update(
+            next_attempt_at=now + timedelta(seconds=settings.MQTT_OUTBOX_LEASE_SECONDS)
+        )
+
+    if not rows:
+        return 0
+
+    return deliver(publisher, rows, now)
+
+
+def message(row):
+    """
+    The payload published for ``row``. JSON commands carry the row id
+    as "id": QoS 1 delivers at least once, so a box that already ran
+    a command with this id should drop the repeat.
+    """
+    if isinstance(row.payload, dict):
+        return dict(row.payload, id=row.pk)
+
+    return row.payload
+
+
+def deliver(publisher, rows, now):
+    """
+    Publish ``rows``, wait for the broker acks and record the outcome.
+    Rows still held by the publisher from an earlier drain are not
+    published again, only checked for their ack.
+    """
+    pending = []
+    failed = []
+
+    for row in rows:
+        held = _in_flight.get(row.pk)
+
+        # A new publisher (reset or forked worker) lost the old queue
+        if held and held[0] is publisher:
+            pending.append((row, held[1]))
+            continue
+
+        try:
+            pending.append((row, publisher.publish(row.topic, message(row))))
+        except Exception as e:
+            failed.append((row, str(e)))
+
+    started = time.monotonic()
+    deadline = started + settings.MQTT_OUTBOX_PUBLISH_TIMEOUT
+    delivered = []
+
+    for row, info in pending:
+        try:
+            info.wait_for_publish(max(deadline - time.monotonic(), 0))
+            published = info.is_published()
+
+        except (RuntimeError, ValueError) as e:
+            # paho gave up on this message: safe to publish again
+            _in_flight.pop(row.pk, None)
+            PUBLISH_FAILURES.inc()
+            failed.append((row, str(e)))
+            continue
+
+        if published:
+            _in_flight.pop(row.pk, None)
+            PUBLISH_SECONDS.observe(time.monotonic() - started)
+            delivered.append(row.pk)
+        else:
+            _in_flight[row.pk] = (publisher, info)
+            PUBLISH_FAILURES.inc()
+            failed.append((row, "Broker did not acknowledge publish"))
+
+    MQTTOutbox.objects.filter(pk__in=delivered).update(
+        delivered_at=timezone.now()
+    )
+
+    for row, error in failed:
+        MQTTOutbox.objects.filter(pk=row.pk).update(
+            attempts=row.attempts + 1,
+            next_attempt_at=now + timedelta(seconds=backoff(row.attempts + 1)),
+            last_error=error
+        )
+
+    if failed:
+        print(f"MQTT OUTBOX: {len(failed)} publish(es) will be retried")
+
+    return len(delivered)
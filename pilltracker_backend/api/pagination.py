@@ -0,0 +1,23 @@
+from rest_framework.pagination import CursorPagination
+
+
+# ----------------------------
+# Keyset (cursor) pagination
+# ----------------------------
+class IdCursorPagination(CursorPagination):
+    """
+    Default for every list endpoint: newest rows first, keyed on the
+    primary key so each page is an index range scan.
+    """
+    ordering = '-id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class CreatedAtCursorPagination(IdCursorPagination):
+    ordering = ('-created_at', '-id')
+
+
+class TimestampCursorPagination(IdCursorPagination):
+    ordering = ('-timestamp', '-id')
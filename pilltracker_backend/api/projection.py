@@ -0,0 +1,127 @@
+import json
+from collections import namedtuple
+from .models import PillBox, PillBoxStatus
+
+
+StatusUpdate = namedtuple("StatusUpdate", ["device_id", "slot_status", "reported_at"])
+
+
+def parse_status(topic, payload, received_at):
+    """
+    Parse one status message into a StatusUpdate, or None if it carries
+    no slot state. The device comes from a pillbox/<device_id>/status
+    topic, or from the payload's "device_id"/"device" key on the shared
+    topic. Slots are read from a "slots" object or from top-level
+    "slotN" keys, e.g. {"slot1": "filled", "slot2": "empty"}.
+    """
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        return None
+
+    if not isinstance(data, dict):
+        return None
+
+    parts = topic.split("/")
+
+    if len(parts) == 3 and parts[0] == "pillbox" and parts[2] == "status":
+        device_id = parts[1]
+    else:
+        device_id = data.get("device_id") or data.get("device")
+
+    if not device_id:
+        return None
+
+    slots = data.get("slots")
+
+    if slots is None:
+        slots = {key: value for key, value in data.items() if key.startswith("slot")}
+
+    if not isinstance(slots, dict) or not slots:
+        return None
+
+    return StatusUpdate(
+        str(device_id),
+        {str(slot): value for slot, value in slots.items()},
+        received_at
+    )
+
+
+def merge(older, newer):
+    """
+    One StatusUpdate from two reports of the same device: a report may
+    carry only some slots, so the newer report's slots win and the
+    older report's other slots are kept.
+    """
+    if newer.reported_at < older.reported_at:
+        older, newer = newer, older
+
+    return newer._replace(slot_status={**older.slot_status, **newer.slot_status})
+
+
+def project_status(batch):
+    """
+    Fold a batch of (topic, payload, received_at) messages into
+    PillBoxStatus. Reports are merged slot by slot into the stored state,
+    newest slot value winning; a report older than the stored
+    ``reported_at`` is ignored. All devices are upserted with one
+    INSERT ... ON CONFLICT. Messages from devices not linked to a patient
+    are ignored. Returns the number of rows written.
+    """
+    latest = {}
+
+    for topic, payload, received_at in batch:
+        update = parse_status(topic, payload, received_at)
+
+        if update is None:
+            continue
+
+        previous = latest.get(update.device_id)
+        latest[update.device_id] = merge(previous, update) if previous else update
+
+    if not latest:
+        return 0
+
+    patients = dict(
+        PillBox.objects.filter(
+            device_id__in=latest,
+            patient__isnull=False
+        ).values_list('device_id', 'patient_id')
+    )
+
+    stored = {
+        patient_id: (slot_status, reported_at)
+        for patient_id, slot_status, reported_at in PillBoxStatus.objects.filter(
+            patient_id__in=patients.values()
+        ).values_list('patient_id', 'slot_status', 'reported_at')
+    }
+
+    rows = []
+
+    for device_id, update in latest.items():
+        if device_id not in patients:
+            continue
+
+        slot_status, reported_at = stored.get(patients[device_id], ({}, None))
+
+        # Out of order: the stored state is already newer
+        if reported_at and update.reported_at <= reported_at:
+            continue
+
+        rows.append(PillBoxStatus(
+            patient_id=patients[device_id],
+            slot_status={**slot_status, **update.slot_status},
+            reported_at=update.reported_at
+        ))
+
+    if not rows:
+        return 0
+
+    PillBoxStatus.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['patient'],
+        update_fields=['slot_status', 'reported_at', 'last_updated']
+    )
+
+    return len(rows)
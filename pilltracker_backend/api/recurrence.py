@@ -0,0 +1,126 @@
+from calendar import monthrange
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+from django.utils import timezone
+
+
+DAILY = "Daily"
+WEEKLY = "Weekly"
+MONTHLY = "Monthly"
+
+
+def occurrence_dates(frequency, start_date, end_date=None, from_date=None):
+    """
+    Dates on which a schedule is due, from ``from_date`` (default: the
+    start date) through ``end_date``. Endless when there is no end date.
+
+    Weekly repeats on the start date's weekday. Monthly repeats on the
+    start date's day of the month, moved to the last day in shorter
+    months (a dose on the 31st is still taken in February). Anything
+    else is treated as Daily.
+    """
+    day = max(from_date or start_date, start_date)
+
+    if frequency == MONTHLY:
+        year, month = day.year, day.month
+
+        while True:
+            candidate = date(
+                year,
+                month,
+                min(start_date.day, monthrange(year, month)[1])
+            )
+
+            if end_date and candidate > end_date:
+                return
+
+            if candidate >= day:
+                yield candidate
+
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    step = timedelta(days=7 if frequency == WEEKLY else 1)
+
+    if frequency == WEEKLY:
+        day += timedelta(days=(start_date.weekday() - day.weekday()) % 7)
+
+    while not end_date or day <= end_date:
+        yield day
+        day += step
+
+
+@lru_cache(maxsize=None)
+def zone(name):
+    """
+    ZoneInfo for an IANA name; the server time zone when empty.
+    """
+    return ZoneInfo(name) if name else timezone.get_default_timezone()
+
+
+def schedule_zone(schedule):
+    """
+    Time zone a Medication/PillSchedule's wall-clock time is in: the
+    patient's. Reads a ``patient_timezone`` annotation when present to
+    avoid loading the patient.
+    """
+    name = getattr(schedule, 'patient_timezone', None)
+
+    if name is None:
+        name = schedule.patient.timezone
+
+    return zone(name)
+
+
+def due_at(day, wall_time, tz):
+    """
+    The instant (UTC) of ``wall_time`` on ``day`` in ``tz``. A time
+    skipped by a DST jump fires at the offset before the jump (02:30
+    becomes 03:30); a repeated time fires at its first occurrence.
+    """
+    return datetime.combine(day, wall_time, tzinfo=tz).astimezone(dt_timezone.utc)
+
+
+def occurrences(schedule, start, end, tz=None):
+    """
+    Aware datetimes in [start, end] at which ``schedule`` (anything with
+    frequency, time, start_date and end_date, e.g. a Medication) is due.
+    Dates and times are read in ``tz`` (default: the server time zone).
+    """
+    tz = tz or timezone.get_default_timezone()
+
+    for day in occurrence_dates(
+        schedule.frequency,
+        schedule.start_date,
+        schedule.end_date,
+        timezone.localtime(start, tz).date()
+    ):
+        instant = due_at(day, schedule.time, tz)
+
+        if instant > end:
+            return
+
+        if instant >= start:
+            yield instant
+
+
+def next_occurrence(schedule, after, tz=None):
+    """
+    First time ``schedule`` is due strictly after ``after``, or None once
+    its end date has passed.
+    """
+    tz = tz or timezone.get_default_timezone()
+
+    for day in occurrence_dates(
+        schedule.frequency,
+        schedule.start_date,
+        schedule.end_date,
+        timezone.localtime(after, tz).date()
+    ):
+        instant = due_at(day, schedule.time, tz)
+
+        if instant > after:
+            return instant
+
+    return None
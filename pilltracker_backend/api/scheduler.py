@@ -1,80 +1,608 @@
+import heapq
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
 from django.utils import timezone
-from .models import Medication, Dispense
-import paho.mqtt.publish as publish
-import json
+from .caching import invalidate_next_medication
+from .doses import materialize_doses
+from .metrics import (
+    Gauge,
+    Histogram,
+    TICK_SECONDS,
+    DOSES_PER_TICK,
+    DOSES_DISPATCHED,
+    DOSES_MISFIRED,
+    JOB_FAILURES
+)
+from .models import Medication, Dispense, DoseInstance
+from .mqtt_client import device_topic, get_publisher, start_mqtt
+from .notifications import run_notification_job
+from .outbox import enqueue_many, drain_outbox
+from .recurrence import next_occurrence, schedule_zone
+from .utils import reserve_writes, run_alert_job
 
 
-def check_medications():
+def due_medications(floor, until):
+    """
+    Medications whose next occurrence is in [floor, until]: one UTC
+    range across every patient's time zone. Inactive and off-day rows
+    are never in the window. Served by ``medication_next_due_idx``.
+    """
+    return Medication.objects.filter(
+        next_due_at__gte=floor,
+        next_due_at__lte=until
+    ).order_by('next_due_at').only(
+        'id',
+        'patient_id',
+        'name',
+        'dosage',
+        'time',
+        'compartment',
+        'frequency',
+        'start_date',
+        'end_date',
+        'next_due_at'
+    ).annotate(
+        device_id=F('patient__pillbox__device_id'),
+        patient_timezone=F('patient__timezone')
+    )
+
+
+def claim_due_medications(floor, until):
+    """
+    Claim up to DISPATCH_BATCH_SIZE of the medications due in
+    [floor, until], earliest first, for this dispatcher. Call inside
+    transaction.atomic() after reserve_writes(); claims are held until
+    commit.
+
+    Where the database supports it the due rows are locked with
+    SELECT ... FOR UPDATE SKIP LOCKED, so concurrent dispatchers split
+    the work instead of waiting on each other. On SQLite the write lock
+    from reserve_writes() already serializes dispatchers, so the rows
+    are read as they are and moved on by dispatch()'s bulk update.
+    """
+    due = due_medications(floor, until)
+
+    if connection.features.has_select_for_update_skip_locked:
+        due = due.select_for_update(skip_locked=True, of=('self',))
+
+    return list(due[:settings.DISPATCH_BATCH_SIZE])
+
+
+def skip_misfired(floor, until):
+    """
+    Move medications whose occurrence is older than ``floor`` on to
+    their next occurrence without dispensing. Returns how many.
+    """
+    late = list(Medication.objects.filter(next_due_at__lt=floor).only(
+        'id',
+        'time',
+        'frequency',
+        'start_date',
+        'end_date',
+        'next_due_at'
+    ).annotate(
+        patient_timezone=F('patient__timezone')
+    ))
+
+    DoseInstance.objects.filter(
+        medication_id__in=[med.pk for med in late],
+        status=DoseInstance.PENDING,
+        due_at__lt=floor
+    ).update(status=DoseInstance.MISSED)
+
+    for med in late:
+        med.next_due_at = next_occurrence(med, until, schedule_zone(med))
+
+    Medication.objects.bulk_update(late, ['next_due_at'])
+
+    return len(late)
+
+
+def dose_count(dosage):
+    return int(dosage) if str(dosage).isdigit() else 1
 
-    now = timezone.localtime(timezone.now())
 
-    current_time = now.strftime("%H:%M")
-    today = now.date()
+def dispatch(medications, now, until=None):
+    """
+    Dispense ``medications`` as one MQTT command per patient listing
+    every motor and dose due, with one bulk insert of Dispense rows and
+    one bulk update moving each medication to its first occurrence
+    after ``until`` (default: now). Each command goes to the patient's
+    own box when ``device_id`` is annotated. Returns the number of doses.
+    """
+    if not medications:
+        return 0
 
-    medications = Medication.objects.all()
+    until = until or now
 
-    print("Checking schedules:", current_time)
+    by_patient = defaultdict(list)
 
     for med in medications:
+        by_patient[med.patient_id].append(med)
 
-        med_time = med.time.strftime("%H:%M")
+    # Commands, logs and state change commit together;
+    # the outbox drainer delivers the commands
+    with transaction.atomic():
 
-        print(f"{med.name} -> {med_time}")
+        enqueue_many([
+            (device_topic(getattr(meds[0], 'device_id', None), "dispense"), {
+                "patient": patient_id,
+                "doses": [
+                    {
+                        "motor": med.compartment,
+                        "medicine": med.name,
+                        "dose": dose_count(med.dosage)
+                    }
+                    for med in meds
+                ]
+            })
+            for patient_id, meds in by_patient.items()
+        ])
 
-        # Prevent duplicate dispensing
-        if med.last_dispensed_date == today:
-            continue
+        # Save dispense logs
+        Dispense.objects.bulk_create([
+            Dispense(
+                medication=med,
+                pill_name=med.name,
+                compartment=med.compartment,
+                status="Dispensed"
+            )
+            for med in medications
+        ])
 
-        if med_time == current_time:
+        DoseInstance.objects.filter(
+            medication_id__in=[med.pk for med in medications],
+            status=DoseInstance.PENDING,
+            due_at__lte=until
+        ).update(status=DoseInstance.DISPENSED)
 
-            print(f"Dispensing {med.name}")
+        # Record the occurrence and move on to the next one
+        for med in medications:
+            tz = schedule_zone(med)
+            med.last_dispensed_date = timezone.localtime(med.next_due_at, tz).date()
+            med.status = "Taken"
+            med.last_taken = now
+            med.next_due_at = next_occurrence(med, until, tz)
 
-            # MQTT payload
-            message = {
-                "motor": med.compartment,
-                "medicine": med.name
-            }
+        Medication.objects.bulk_update(medications, [
+            'last_dispensed_date',
+            'status',
+            'last_taken',
+            'next_due_at'
+        ])
 
-            try:
+        # update() sends no signals
+        invalidate_next_medication(*by_patient)
+
+    for patient_id, meds in by_patient.items():
+        print(f"Dispensing {', '.join(med.name for med in meds)} for patient {patient_id}")
+
+    return len(medications)
+
+
+def check_medications(now=None, lookahead=timedelta(0)):
+    """
+    Dispense every medication whose next occurrence is due by
+    ``now + lookahead``. A medication's ``next_due_at`` only moves on
+    once it is dispensed or skipped, so doses missed while no
+    dispatcher ran are still due and a call after a restart or a stall
+    catches up. At most DISPATCH_BATCH_SIZE doses are dispensed per
+    call; call again while it returns a full batch.
+
+    Doses more than DISPATCH_MISFIRE_GRACE_SECONDS late are skipped
+    rather than dispensed hours after they were due.
+    """
+
+    started = time.perf_counter()
+
+    now = timezone.localtime(now or timezone.now())
+
+    until = now + lookahead
+
+    floor = until - timedelta(seconds=settings.DISPATCH_MISFIRE_GRACE_SECONDS)
+
+    # Claim and dispense in one transaction: exactly one Dispense per
+    # dose however many dispatchers run
+    with transaction.atomic():
+
+        reserve_writes(Medication)
+
+        skipped = skip_misfired(floor, until)
+
+        dispatched = dispatch(claim_due_medications(floor, until), now, until)
+
+    if skipped:
+        print(f"⚠️ Skipped {skipped} dose(s) due before {floor} (past misfire grace)")
+
+    TICK_SECONDS.observe(time.perf_counter() - started)
+    DOSES_PER_TICK.observe(dispatched)
+    DOSES_DISPATCHED.inc(dispatched)
+    DOSES_MISFIRED.inc(skipped)
+
+    return dispatched
+
+
+DISPATCH_LAG = Histogram(
+    "pillbox_dispatch_lag_seconds",
+    "Delay between a dose's scheduled time and the dispatcher waking for it.",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+)
+
+
+class DoseDispatcher:
+    """
+    Dispatches doses at their scheduled second instead of polling.
+
+    Keeps a min-heap of (next_due_at, medication id) and sleeps until
+    the earliest entry is due or the next refresh, whichever is sooner.
+    Medications changed since the last refresh (``updated_at``) are
+    re-read every DISPATCHER_REFRESH_SECONDS; the whole heap is rebuilt
+    every DISPATCHER_RELOAD_SECONDS to drop deleted rows. Entries are
+    invalidated lazily: ``entries`` holds each medication's current fire
+    time and stale heap items are skipped when popped.
+
+    Medications are saved by the web process, so the dispatcher learns
+    of a new or edited medication on its next refresh: a dose due within
+    DISPATCHER_REFRESH_SECONDS of being saved may fire that late (the
+    misfire grace covers it).
+
+    The heap only decides when to wake. Each wake dispenses everything
+    due by ``now + jitter`` through check_medications(), so the database
+    remains the source of truth and several dispatchers can run side by
+    side. The first wake always runs, catching up on doses due while no
+    dispatcher was running.
+    """
+
+    def __init__(self, jitter_ms=None, refresh_seconds=None, reload_seconds=None):
+        self.jitter = timedelta(milliseconds=(
+            jitter_ms if jitter_ms is not None else settings.DISPATCHER_JITTER_MS
+        ))
+        self.refresh_seconds = refresh_seconds or settings.DISPATCHER_REFRESH_SECONDS
+        self.reload_seconds = reload_seconds or settings.DISPATCHER_RELOAD_SECONDS
+        self.heap = []
+        self.entries = {}
+        self.last_tick = None
+        self.last_refresh = None
+        self.last_reload = None
+        self.heartbeat = time.monotonic()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run,
+            name="dose-dispatcher",
+            daemon=True
+        )
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def depth(self):
+        return len(self.entries)
+
+    def push(self, medication_id, fire_at):
+        self.entries[medication_id] = fire_at
+        heapq.heappush(self.heap, (fire_at, medication_id))
+
+    def peek(self):
+        # Drop invalidated entries from the top of the heap
+        while self.heap and self.entries.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, until):
+        due = []
+
+        while self.peek() is not None and self.heap[0][0] <= until:
+            fire_at, medication_id = heapq.heappop(self.heap)
+            del self.entries[medication_id]
+            due.append((fire_at, medication_id))
+
+        return due
+
+    def load(self, now, changed_since=None):
+        """
+        Schedule every medication, or only those changed since
+        ``changed_since``. Rows are read in full before the heap changes,
+        so a failed read keeps the previous schedule and the pass is
+        retried on the next wake.
+        """
+        medications = Medication.objects.all()
+
+        if changed_since is None:
+            medications = medications.filter(next_due_at__isnull=False)
+        else:
+            medications = medications.filter(updated_at__gte=changed_since)
+
+        rows = []
+
+        for n, row in enumerate(medications.values_list('id', 'next_due_at').iterator(chunk_size=2000)):
+            # A full reload of a large table is still progress
+            if n % 2000 == 0:
+                self.heartbeat = time.monotonic()
+
+            rows.append(row)
+
+        if changed_since is None:
+            heap = [(next_due_at, pk) for pk, next_due_at in rows]
+            heapq.heapify(heap)
 
-                publish.single(
-                    topic="pillbox/dispense",
-                    payload=json.dumps(message),
-                    hostname="broker.hivemq.com"
-                )
+            self.heap = heap
+            self.entries = dict(rows)
+            self.last_reload = now
+        else:
+            self.schedule(rows)
 
-                print("MQTT message sent")
+        self.last_refresh = now
 
-                # Save dispense log
-                Dispense.objects.create(
-                    medication=med,
-                    pill_name=med.name,
-                    compartment=med.compartment,
-                    status="Dispensed"
-                )
+    def schedule(self, rows):
+        for pk, next_due_at in rows:
+            if next_due_at is None:
+                # Ended; any heap item is now stale
+                self.entries.pop(pk, None)
+            else:
+                self.push(pk, next_due_at)
 
-                # Update medication
-                med.last_dispensed_date = today
-                med.status = "Taken"
-                med.last_taken = now
-                med.save()
+    def refresh(self, now):
+        if self.last_reload is None or now - self.last_reload >= timedelta(seconds=self.reload_seconds):
+            self.load(now)
+        elif now - self.last_refresh >= timedelta(seconds=self.refresh_seconds):
+            # Overlap by a second so a save racing the previous refresh is not missed
+            self.load(now, changed_since=self.last_refresh - timedelta(seconds=1))
+
+    def tick(self, now):
+        until = now + self.jitter
+
+        due = self.pop_due(until)
+
+        # The first tick catches up on doses missed while stopped
+        catch_up = self.last_tick is None
+
+        if not due and not catch_up:
+            self.last_tick = until
+            return
+
+        try:
+            # Batch by batch, so a long catch-up still shows progress
+            while check_medications(now=now, lookahead=self.jitter) >= settings.DISPATCH_BATCH_SIZE:
+                self.heartbeat = time.monotonic()
+
+        except Exception:
+            # Retry the same doses on the next wake
+            for fire_at, medication_id in due:
+                self.push(medication_id, fire_at)
+            raise
+
+        self.last_tick = until
+
+        grace = timedelta(seconds=settings.DISPATCH_MISFIRE_GRACE_SECONDS)
+
+        for fire_at, medication_id in due:
+            if now - fire_at <= grace:
+                DISPATCH_LAG.observe(max((now - fire_at).total_seconds(), 0))
+
+        # Dispatched rows moved on to their next occurrence
+        self.schedule(Medication.objects.filter(
+            pk__in=[medication_id for fire_at, medication_id in due]
+        ).values_list('id', 'next_due_at'))
+
+    def run(self):
+        while not self.stopping.is_set():
+
+            self.heartbeat = time.monotonic()
+
+            now = timezone.now()
+
+            # Sleep until the next dose or the next refresh
+            timeout = self.refresh_seconds
+
+            try:
+                self.refresh(now)
+                self.tick(now)
 
             except Exception as e:
+                print("❌ DISPATCHER ERROR:", e)
+                # Reconnect and back off before retrying
+                connection.close()
+                timeout = 1
 
-                print("MQTT ERROR:", e)
+            next_fire = self.peek()
 
+            if next_fire is not None:
+                timeout = min(timeout, (next_fire - timezone.now()).total_seconds())
 
-def start():
+            self.wakeup.wait(max(timeout, 0))
+            self.wakeup.clear()
 
-    scheduler = BackgroundScheduler()
+        connection.close()
 
-    scheduler.add_job(
-        check_medications,
-        'interval',
-        minutes=1
-    )
+    def stop(self, timeout=10):
+        self.stopping.set()
+        self.wakeup.set()
+        self.thread.join(timeout)
+
+
+_dispatchers = []
+
+DISPATCHER_HEAP = Gauge(
+    "pillbox_dispatcher_scheduled_medications",
+    "Medications scheduled in the dispatcher heap.",
+    lambda: sum(dispatcher.depth() for dispatcher in _dispatchers)
+)
+
+
+def start_dispatcher(**kwargs):
+    dispatcher = DoseDispatcher(**kwargs).start()
+    _dispatchers.append(dispatcher)
+    return dispatcher
+
+
+class Job:
+    """
+    A periodic job run by the Worker's APScheduler. Connections that
+    are unusable or past CONN_MAX_AGE are closed before and after each
+    run, as Django does around a request, so a dropped connection fails
+    one run instead of every run. Failures are counted for health().
+    """
+
+    def __init__(self, function):
+        self.function = function
+        self.name = function.__name__
+        self.failures = 0
+        self.consecutive_failures = 0
+
+    def __call__(self):
+        close_old_connections()
+
+        try:
+            self.function()
+
+        except Exception as e:
+            self.failures += 1
+            self.consecutive_failures += 1
+            JOB_FAILURES.inc()
+            print(f"❌ JOB {self.name} FAILED:", e)
+
+        else:
+            self.consecutive_failures = 0
+
+        finally:
+            close_old_connections()
+
+
+class Worker:
+    """
+    Everything the dispatcher process runs: the dose dispatcher, the
+    outbox drainer, alert, notification and dose materialization jobs
+    (APScheduler) and pillbox status ingestion. Started by ``manage.py run_dispatcher``.
+    """
+
+    def __init__(self):
+        self.scheduler = BackgroundScheduler()
+
+        self.jobs = [
+            Job(drain_outbox),
+            Job(run_alert_job),
+            Job(run_notification_job),
+            Job(materialize_doses),
+        ]
+
+        outbox, alerts, notifications, doses = self.jobs
+
+        self.scheduler.add_job(
+            outbox,
+            'interval',
+            seconds=settings.MQTT_OUTBOX_DRAIN_SECONDS
+        )
+
+        self.scheduler.add_job(
+            alerts,
+            'interval',
+            seconds=settings.ALERT_JOB_SECONDS
+        )
+
+        self.scheduler.add_job(
+            notifications,
+            'interval',
+            seconds=settings.NOTIFICATION_SECONDS
+        )
+
+        # Also once at startup
+        self.scheduler.add_job(
+            doses,
+            'interval',
+            seconds=settings.DOSE_MATERIALIZE_SECONDS,
+            next_run_time=timezone.now()
+        )
+
+        self.dispatcher = None
+        self.listener = None
+
+    def start(self):
+        self.scheduler.start()
+
+        # Dose dispensing (next-fire-time heap)
+        self.dispatcher = start_dispatcher()
+
+        # Pillbox status ingestion
+        self.listener = start_mqtt()
+
+        print("Scheduler started")
+
+        return self
+
+    def health(self):
+        """
+        Liveness of each component. ``ok`` is False when a thread died,
+        the dispatcher loop stalled or a job failed
+        WORKER_JOB_MAX_FAILURES runs in a row; a disconnected broker is
+        reported but is not fatal, paho reconnects on its own.
+        """
+        dispatcher_age = time.monotonic() - self.dispatcher.heartbeat
+
+        components = {
+            "dispatcher": {
+                "alive": self.dispatcher.thread.is_alive(),
+                "seconds_since_loop": round(dispatcher_age, 3),
+                "scheduled": self.dispatcher.depth(),
+            },
+            "scheduler": {
+                "alive": self.scheduler.running,
+            },
+            "ingestor": {
+                "alive": self.listener.ingestor.thread.is_alive(),
+                "queue": self.listener.ingestor.depth(),
+            },
+            "mqtt": {
+                "connected": get_publisher().is_connected(),
+            },
+            "jobs": {
+                job.name: {
+                    "failures": job.failures,
+                    "consecutive_failures": job.consecutive_failures,
+                }
+                for job in self.jobs
+            },
+        }
+
+        ok = (
+            components["dispatcher"]["alive"]
+            and dispatcher_age < 2 * self.dispatcher.refresh_seconds + 1
+            and components["scheduler"]["alive"]
+            and components["ingestor"]["alive"]
+            and all(
+                job.consecutive_failures < settings.WORKER_JOB_MAX_FAILURES
+                for job in self.jobs
+            )
+        )
+
+        return {"ok": ok, **components}
+
+    def stop(self):
+        """
+        Stop taking new work, finish what is in flight and deliver
+        what is already queued.
+        """
+        self.scheduler.shutdown(wait=True)
+
+        if self.dispatcher:
+            self.dispatcher.stop()
+
+        if self.listener:
+            self.listener.stop()
+
+        try:
+            drain_outbox()
+        except Exception as e:
+            print("❌ OUTBOX DRAIN ERROR:", e)
 
-    scheduler.start()
+        get_publisher().stop()
 
-    print("Scheduler started")
\ No newline at end of file
+        print("Scheduler stopped")
@@ -1,19 +1,56 @@
 from rest_framework import serializers
+from .middleware import timed_serialization
 from .models import (
     Patient,
     Doctor,
     PillSchedule,
     PillIntake,
     PillBoxStatus,
+    PillBox,
     Alert,
     RefillLog,
     Medication,Dispense
 )
 
+
+# ----------------------------
+# ⏱️ Timed base (request metrics)
+# ----------------------------
+class TimedDataMixin:
+    """
+    Counts the time spent in ``.data`` towards the request's
+    ``serialize_ms`` (RequestMetricsMiddleware).
+    """
+
+    @property
+    def data(self):
+        with timed_serialization():
+            return super().data
+
+
+class TimedListSerializer(TimedDataMixin, serializers.ListSerializer):
+    pass
+
+
+class TimedModelSerializer(TimedDataMixin, serializers.ModelSerializer):
+    """
+    ModelSerializer timed for one object and, through
+    TimedListSerializer, for ``many=True``.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        meta = getattr(cls, 'Meta', None)
+
+        if meta is not None and not hasattr(meta, 'list_serializer_class'):
+            meta.list_serializer_class = TimedListSerializer
+
+
 # ----------------------------
 # 👨‍⚕️ Doctor Serializer
 # ----------------------------
-class DoctorSerializer(serializers.ModelSerializer):
+class DoctorSerializer(TimedModelSerializer):
     class Meta:
         model = Doctor
         fields = "__all__"
@@ -30,7 +67,7 @@ class LoginSerializer(serializers.Serializer):
 # ----------------------------
 # 🧍 Patient Serializer (FIXED)
 # ----------------------------
-class PatientSerializer(serializers.ModelSerializer):
+class PatientSerializer(TimedModelSerializer):
     # IMPORTANT: email must NOT be required (backend generates it)
     email = serializers.EmailField(
         required=False,
@@ -77,6 +114,7 @@ class PatientSerializer(serializers.ModelSerializer):
             "mail",
             "phone",
             "address",
+            "timezone",
         ]
 
     def validate(self, data):
@@ -99,7 +137,7 @@ class PatientSerializer(serializers.ModelSerializer):
 # ----------------------------
 # 💊 Pill Schedule
 # ----------------------------
-class PillScheduleSerializer(serializers.ModelSerializer):
+class PillScheduleSerializer(TimedModelSerializer):
     class Meta:
         model = PillSchedule
         fields = "__all__"
@@ -108,7 +146,7 @@ class PillScheduleSerializer(serializers.ModelSerializer):
 # ----------------------------
 # 💊 Pill Intake
 # ----------------------------
-class PillIntakeSerializer(serializers.ModelSerializer):
+class PillIntakeSerializer(TimedModelSerializer):
     class Meta:
         model = PillIntake
         fields = "__all__"
@@ -117,16 +155,25 @@ class PillIntakeSerializer(serializers.ModelSerializer):
 # ----------------------------
 # 📦 Pill Box Status
 # ----------------------------
-class PillBoxStatusSerializer(serializers.ModelSerializer):
+class PillBoxStatusSerializer(TimedModelSerializer):
     class Meta:
         model = PillBoxStatus
         fields = "__all__"
 
 
+# ----------------------------
+# 📟 Pill Box Device
+# ----------------------------
+class PillBoxSerializer(TimedModelSerializer):
+    class Meta:
+        model = PillBox
+        fields = "__all__"
+
+
 # ----------------------------
 # 🚨 Alert
 # ----------------------------
-class AlertSerializer(serializers.ModelSerializer):
+class AlertSerializer(TimedModelSerializer):
     class Meta:
         model = Alert
         fields = "__all__"
@@ -135,17 +182,18 @@ class AlertSerializer(serializers.ModelSerializer):
 # ----------------------------
 # 🔁 Refill Log
 # ----------------------------
-class RefillLogSerializer(serializers.ModelSerializer):
+class RefillLogSerializer(TimedModelSerializer):
     class Meta:
         model = RefillLog
         fields = "__all__"
 
-class MedicationSerializer(serializers.ModelSerializer):
+class MedicationSerializer(TimedModelSerializer):
     class Meta:
         model = Medication
         fields = '__all__'
+        read_only_fields = ['next_due_at']
 
-class DispenseSerializer(serializers.ModelSerializer):
+class DispenseSerializer(TimedModelSerializer):
     class Meta:
         model = Dispense
         fields = '__all__'
\ No newline at end of file
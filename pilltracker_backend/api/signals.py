@@ -0,0 +1,119 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .caching import invalidate_next_medication
+from .doses import mark_taken, rematerialize
+from .models import Medication, Patient, PillIntake, PillSchedule
+from .recurrence import next_occurrence, schedule_zone
+
+# Fields that decide when a medication is next due
+SCHEDULE_FIELDS = ('time', 'frequency', 'start_date', 'end_date', 'patient_id')
+
+
+def reschedule(medication, now=None):
+    """
+    Move ``medication`` to its first occurrence after ``now``, in its
+    patient's time zone, never on a day that was already dispensed. A
+    dose already due that the dispatcher has not claimed yet is left in
+    place so it still goes out; changes apply from the next occurrence.
+    """
+    now = now or timezone.now()
+    due = medication.next_due_at
+    grace = timedelta(seconds=settings.DISPATCH_MISFIRE_GRACE_SECONDS)
+
+    if due and now - grace <= due <= now:
+        return
+
+    tz = schedule_zone(medication)
+
+    after = now
+
+    if medication.last_dispensed_date:
+        after = max(after, datetime.combine(
+            medication.last_dispensed_date, time.max, tzinfo=tz
+        ))
+
+    medication.next_due_at = next_occurrence(medication, after, tz)
+
+
+def schedule_edited(instance, update_fields=None):
+    if update_fields is not None and not set(update_fields) & {
+        'time', 'frequency', 'start_date', 'end_date', 'patient', 'patient_id'
+    }:
+        return False
+
+    loaded = getattr(instance, '_loaded_values', None)
+
+    # New, or built by hand rather than loaded
+    if loaded is None:
+        return True
+
+    return any(
+        name not in loaded or loaded[name] != getattr(instance, name)
+        for name in SCHEDULE_FIELDS
+    )
+
+
+@receiver(pre_save, sender=Medication)
+def schedule_next_dose(sender, instance, update_fields=None, **kwargs):
+    if not schedule_edited(instance, update_fields):
+        return
+
+    reschedule(instance)
+
+    instance._loaded_values = {
+        name: getattr(instance, name) for name in SCHEDULE_FIELDS
+    }
+
+
+@receiver([post_save, post_delete], sender=Medication)
+def medication_changed(sender, instance, **kwargs):
+    invalidate_next_medication(instance.patient_id)
+
+
+@receiver(post_save, sender=Medication)
+@receiver(post_save, sender=PillSchedule)
+def schedule_changed(sender, instance, created, **kwargs):
+    rematerialize(instance, created=created)
+
+
+@receiver(post_save, sender=PillIntake)
+def intake_recorded(sender, instance, **kwargs):
+    if instance.taken:
+        mark_taken(instance.schedule_id, instance.date)
+
+
+@receiver(post_save, sender=Patient)
+def timezone_changed(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_loaded_timezone', None)
+
+    instance._loaded_timezone = instance.timezone
+
+    if created or previous is None or previous == instance.timezone:
+        return
+
+    now = timezone.now()
+
+    # Same wall-clock times, new instants: reschedule every medication
+    # in one update and rebuild the patient's pending doses in one pass
+    medications = list(instance.medications.all())
+
+    for med in medications:
+        med.patient = instance
+        med.updated_at = now
+        reschedule(med, now)
+
+    Medication.objects.bulk_update(medications, ['next_due_at', 'updated_at'])
+
+    schedules = list(instance.schedules.all())
+
+    for schedule in schedules:
+        schedule.patient = instance
+
+    rematerialize(*medications, *schedules)
+
+    invalidate_next_medication(instance.pk)
@@ -1,3 +1,935 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import date, datetime, time, timedelta
+from itertools import islice
+from urllib.error import HTTPError
+from urllib.request import urlopen
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import (
+    Doctor,
+    Patient,
+    PillSchedule,
+    PillIntake,
+    PillBoxStatus,
+    PillBox,
+    Alert,
+    RefillLog,
+    Medication,
+    Dispense,
+    MQTTOutbox,
+    Notification,
+    DoseInstance,
+    PillEvent
+)
+from .doses import materialize_doses
+from .ingestion import StatusIngestor
+from .management.commands.run_dispatcher import health_server
+from .middleware import endpoint_stats
+from .mqtt_client import get_publisher, subscription
+from .notifications import backoff, run_notification_job, send_notifications
+from .outbox import drain_outbox, enqueue
+from .projection import project_status
+from .recurrence import next_occurrence, occurrence_dates, zone
+from .scheduler import DoseDispatcher, Job, check_medications
+from .utils import alert_dedup_key, generate_missed_dose_alerts, run_alert_job
+
+
+def seed(patients, start=0):
+    """
+    ``patients`` patients with a fixed fan-out of related rows each, so
+    per-patient queries see the same data at every scale.
+    """
+    today = date.today()
+
+    doctor = Doctor.objects.first() or Doctor.objects.create(
+        user=User.objects.create_user(username="doctor", password="doctor123"),
+        specialization="General"
+    )
+
+    created = Patient.objects.bulk_create([
+        Patient(
+            doctor=doctor,
+            name=f"Patient {i}",
+            age=60,
+            email=f"patient{i}@example.com"
+        )
+        for i in range(start, start + patients)
+    ])
+
+    schedules = PillSchedule.objects.bulk_create([
+        PillSchedule(
+            patient=patient,
+            pill_name=f"Pill {n}",
+            dosage="1",
+            time=time(8 + 4 * n, 0),
+            start_date=today,
+            end_date=today + timedelta(days=30)
+        )
+        for patient in created
+        for n in range(3)
+    ])
+
+    PillIntake.objects.bulk_create([
+        PillIntake(schedule=schedule, date=today, taken=True)
+        for schedule in schedules
+    ])
+
+    PillBox.objects.bulk_create([
+        PillBox(device_id=f"box-{patient.pk}", patient=patient)
+        for patient in created
+    ])
+
+    PillBoxStatus.objects.bulk_create([
+        PillBoxStatus(patient=patient, slot_status={"slot1": "filled"})
+        for patient in created
+    ])
+
+    Alert.objects.bulk_create([
+        Alert(patient=patient, message="Patient missed Pill 0", alert_type="Missed Dose")
+        for patient in created
+    ])
+
+    medications = Medication.objects.bulk_create([
+        Medication(
+            patient=patient,
+            name=f"Med {n}",
+            dosage="1",
+            time=time(8 + 4 * n, 0),
+            compartment=n + 1,
+            start_date=today
+        )
+        for patient in created
+        for n in range(3)
+    ])
+
+    Dispense.objects.bulk_create([
+        Dispense(medication=med, pill_name=med.name, compartment=med.compartment)
+        for med in medications
+    ])
+
+    RefillLog.objects.bulk_create([
+        RefillLog(pill_name=f"Pill {i}", count=10)
+        for i in range(start, start + patients)
+    ])
+
+
+def due_medication(patient, name="Med", compartment=1, due_at=None):
+    """
+    A saved Medication made due at ``due_at`` (default: now) behind the
+    save signal's back, as if its time had come.
+    """
+    medication = Medication.objects.create(
+        patient=patient,
+        name=name,
+        dosage="2",
+        time=time(8, 0),
+        compartment=compartment,
+        start_date=date.today()
+    )
+
+    Medication.objects.filter(pk=medication.pk).update(next_due_at=due_at or timezone.now())
+    medication.refresh_from_db()
+
+    return medication
+
+
+# Query budgets per route in api/urls.py. Each entry is
+# (label, method, path, body, budget); paths are built from the first
+# seeded rows so they resolve at every scale.
+def routes():
+    patient = Patient.objects.order_by('id').first()
+    medication = patient.medications.order_by('id').first()
+
+    return [
+        ("login", "post", "/api/login/", {"username": "doctor", "password": "doctor123"}, 3),
+        ("doctor-list", "get", "/api/doctors/", None, 1),
+        ("doctor-detail", "get", f"/api/doctors/{patient.doctor_id}/", None, 1),
+        ("patient-list", "get", "/api/patients/", None, 1),
+        ("patient-detail", "get", f"/api/patients/{patient.pk}/", None, 1),
+        ("patient-create", "post", "/api/patients/", {"name": "New", "age": 70, "email": "new@example.com"}, 4),
+        ("patient-delete", "delete", f"/api/patients/{patient.pk}/", None, 16),
+        ("schedule-list", "get", "/api/schedules/", None, 1),
+        ("intake-list", "get", "/api/intakes/", None, 1),
+        ("pillbox-list", "get", "/api/pillbox/", None, 1),
+        ("device-list", "get", "/api/devices/", None, 1),
+        ("device-detail", "get", f"/api/devices/{patient.pillbox.pk}/", None, 1),
+        ("alert-list", "get", "/api/alerts/", None, 1),
+        ("medication-list", "get", f"/api/medications/?patient={patient.pk}", None, 2),
+        ("medication-detail", "get", f"/api/medications/{medication.pk}/", None, 1),
+        ("medication-create", "post", "/api/medications/", {
+            "patient": patient.pk,
+            "name": "New Med",
+            "dosage": "2",
+            "time": "09:30:00",
+            "compartment": 2,
+            "start_date": str(date.today())
+        }, 5),
+        ("dispense-list", "get", "/api/dispense/", None, 0),
+        ("dispense-trigger", "post", "/api/dispense/trigger/", {"hour": 8, "minute": 0, "motor": 1}, 0),
+        ("dispense-trigger-patient", "post", "/api/dispense/trigger/", {"hour": 8, "minute": 0, "motor": 1, "patient": patient.pk}, 1),
+        ("pill-intake", "post", "/api/pill-intake/", {}, 0),
+        ("refill-status", "get", "/api/refill-status/", None, 0),
+        ("refill-log", "get", "/api/refill-log/", None, 1),
+        ("voice-agent", "post", "/api/voice-agent/", {}, 0),
+        ("mqtt-schedule", "post", "/api/schedule/", {"time": "08:00:00", "motor": 1}, 0),
+        ("mqtt-schedule-device", "post", "/api/schedule/", {"time": "08:00:00", "motor": 1, "device": "box-1"}, 1),
+        ("save-schedule", "post", "/api/save-schedule/", {"hour": 8, "minute": 0, "motor": 1}, 3),
+        ("metrics", "get", "/api/metrics/", None, 2),
+    ]
+
+
+@override_settings(
+    MQTT_PUBLISHER_CLASS='pilltracker_backend.api.mqtt_client.LocalPublisher',
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']
+)
+class QueryBudgetTests(TestCase):
+
+    SCALE = 20
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME="localhost")
+
+    def measure(self):
+        counts = {}
+
+        for label, method, path, body, budget in routes():
+
+            # Budgets are for the uncached path
+            cache.clear()
+
+            # Roll back writes so every route sees the same dataset
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as queries:
+                    response = getattr(self.client, method)(path, body, format="json")
+                transaction.set_rollback(True)
+
+            self.assertLess(response.status_code, 400, f"{label}: {response.status_code}")
+
+            # Savepoints are an artefact of the rollback wrapper
+            counts[label] = sum(
+                1 for query in queries.captured_queries
+                if "SAVEPOINT" not in query["sql"]
+            )
+
+        return counts
+
+    def test_query_budgets_do_not_grow_with_data(self):
+        seed(self.SCALE)
+        small = self.measure()
+
+        seed(self.SCALE * 9, start=self.SCALE)
+        large = self.measure()
+
+        for label, method, path, body, budget in routes():
+            with self.subTest(route=label):
+                self.assertLessEqual(large[label], budget)
+                self.assertEqual(small[label], large[label])
+
+
+class AlertReadPathTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME="localhost")
+        seed(1)
+
+    def test_listing_alerts_does_not_generate_them(self):
+        schedule = PillSchedule.objects.first()
+
+        DoseInstance.objects.create(
+            patient=schedule.patient,
+            schedule=schedule,
+            name=schedule.pill_name,
+            due_at=timezone.now() - timedelta(hours=2)
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/alerts/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if query["sql"].startswith(("INSERT", "UPDATE"))
+        ])
+
+        self.assertEqual(run_alert_job(), 1)
+        self.assertEqual(run_alert_job(), 0)
+
+
+class PaginationTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME="localhost")
+        seed(5)
+
+    def test_pages_follow_the_cursor_newest_first(self):
+        first = self.client.get("/api/patients/?page_size=2").json()
+        second = self.client.get(first["next"]).json()
+
+        ids = [row["id"] for row in first["results"] + second["results"]]
+
+        expected = list(Patient.objects.order_by('-id').values_list('id', flat=True)[:4])
+        self.assertEqual(ids, expected)
+
+
+@override_settings(REQUEST_METRICS_ENABLED=True)
+class RequestMetricsTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME="localhost")
+        seed(1)
+
+    def test_request_is_logged_and_counted_per_endpoint(self):
+        with self.assertLogs("pilltracker_backend.api.middleware", "INFO") as logs:
+            self.client.get("/api/patients/")
+
+        line = json.loads(logs.records[-1].getMessage())
+
+        self.assertEqual((line["endpoint"], line["status"], line["queries"]), ("patient-list", 200, 1))
+        self.assertGreater(line["serialize_ms"], 0)
+        self.assertGreater(line["json_render_ms"], 0)
+        self.assertGreaterEqual(endpoint_stats()["patient-list"]["count"], 1)
+
+        body = self.client.get("/api/metrics/").content.decode()
+
+        self.assertIn('pillbox_http_request_duration_seconds_count{endpoint="patient-list"}', body)
+        self.assertIn('pillbox_http_request_serialize_seconds_count{endpoint="patient-list"}', body)
+
+
+class MetricsEndpointTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME="localhost")
+
+    def test_pipeline_metrics_are_exposed(self):
+        enqueue("pillbox/schedule", {"motor": 1})
+        run_alert_job()
+
+        body = self.client.get("/api/metrics/").content.decode()
+
+        self.assertIn("pillbox_doses_dispatched_total", body)
+        self.assertIn("pillbox_alerts_created_per_run_count", body)
+        self.assertIn("pillbox_mqtt_outbox_pending 1", body)
+
+
+class NextMedicationCacheTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME="localhost")
+        cache.clear()
+        seed(1)
+        self.patient = Patient.objects.get()
+        self.path = f"/api/medications/?patient={self.patient.pk}"
+
+    def test_cached_until_a_medication_changes(self):
+        now = timezone.now()
+
+        first = due_medication(self.patient, "First", 1, now + timedelta(hours=1))
+        second = due_medication(self.patient, "Second", 2, now + timedelta(hours=2))
+
+        self.assertEqual(self.client.get(self.path).json()["results"][0]["id"], first.pk)
+
+        with self.assertNumQueries(0):
+            self.client.get(self.path)
+
+        # Another page size is its own entry
+        with self.assertNumQueries(1):
+            self.client.get(self.path + "&page_size=1")
+
+        # update() sends no signal: still cached
+        Medication.objects.filter(pk=second.pk).update(next_due_at=now + timedelta(minutes=1))
+        self.assertEqual(self.client.get(self.path).json()["results"][0]["id"], first.pk)
+
+        # A save invalidates once it commits
+        with self.captureOnCommitCallbacks(execute=True):
+            Medication.objects.get(pk=second.pk).save()
+
+        self.assertEqual(self.client.get(self.path).json()["results"][0]["id"], second.pk)
+
+
+class DispatchTests(TestCase):
+
+    def setUp(self):
+        seed(2)
+        self.patients = list(Patient.objects.order_by('id'))
+
+    def test_one_command_per_patient_for_all_due_compartments(self):
+        for patient in self.patients:
+            due_medication(patient, "A", 1)
+            due_medication(patient, "B", 2)
+
+        self.assertEqual(check_medications(), 4)
+
+        commands = {row.topic: row.payload for row in MQTTOutbox.objects.all()}
+
+        self.assertEqual(len(commands), 2)
+
+        payload = commands[f"pillbox/box-{self.patients[0].pk}/dispense"]
+        self.assertEqual(sorted(dose["motor"] for dose in payload["doses"]), [1, 2])
+        self.assertEqual({dose["dose"] for dose in payload["doses"]}, {2})
+
+    def test_a_dose_is_claimed_once(self):
+        medication = due_medication(self.patients[0])
+
+        self.assertEqual(check_medications(), 1)
+        self.assertEqual(check_medications(), 0)
+        self.assertEqual(Dispense.objects.filter(medication=medication).count(), 1)
+
+    @override_settings(DISPATCH_BATCH_SIZE=2)
+    def test_claims_are_made_in_batches(self):
+        for n in range(3):
+            due_medication(self.patients[0], f"Med {n}", n + 1)
+
+        self.assertEqual(check_medications(), 2)
+        self.assertEqual(check_medications(), 1)
+
+    def test_late_doses_are_caught_up_within_grace_and_skipped_beyond(self):
+        now = timezone.now()
+        grace = timedelta(seconds=settings.DISPATCH_MISFIRE_GRACE_SECONDS)
+
+        recent = due_medication(self.patients[0], "Recent", 1, now - timedelta(minutes=10))
+        stale = due_medication(self.patients[0], "Stale", 2, now - grace - timedelta(minutes=1))
+
+        self.assertEqual(check_medications(now), 1)
+        self.assertTrue(Dispense.objects.filter(medication=recent).exists())
+        self.assertFalse(Dispense.objects.filter(medication=stale).exists())
+
+        stale.refresh_from_db()
+        self.assertGreater(stale.next_due_at, now)
+
+    def test_dispatcher_wakes_for_the_earliest_dose(self):
+        now = timezone.now()
+
+        soon = due_medication(self.patients[0], "Soon", 1, now + timedelta(seconds=30))
+        later = due_medication(self.patients[0], "Later", 2, now + timedelta(hours=1))
+
+        dispatcher = DoseDispatcher(jitter_ms=0)
+        dispatcher.refresh(now)
+
+        self.assertEqual(dispatcher.peek(), soon.next_due_at)
+
+        dispatcher.tick(now)
+        self.assertFalse(Dispense.objects.filter(medication__in=[soon, later]).exists())
+
+        dispatcher.tick(soon.next_due_at)
+        self.assertEqual(
+            list(Dispense.objects.filter(medication__in=[soon, later]).values_list('medication', flat=True)),
+            [soon.pk]
+        )
+        self.assertEqual(dispatcher.peek(), later.next_due_at)
+
+    def test_failed_load_keeps_the_schedule_and_is_retried(self):
+        now = timezone.now()
+
+        soon = due_medication(self.patients[0], "Soon", 1, now + timedelta(seconds=30))
+
+        def lose_connection(execute, sql, params, many, context):
+            if sql.startswith("SELECT") and Medication._meta.db_table in sql:
+                raise DatabaseError("connection lost")
+            return execute(sql, params, many, context)
+
+        dispatcher = DoseDispatcher(jitter_ms=0, reload_seconds=60)
+
+        with connection.execute_wrapper(lose_connection), self.assertRaises(DatabaseError):
+            dispatcher.refresh(now)
+
+        dispatcher.refresh(now)
+        self.assertEqual(dispatcher.peek(), soon.next_due_at)
+
+        later = now + timedelta(seconds=60)
+
+        with connection.execute_wrapper(lose_connection), self.assertRaises(DatabaseError):
+            dispatcher.refresh(later)
+
+        self.assertEqual(dispatcher.peek(), soon.next_due_at)
+        self.assertEqual(dispatcher.last_reload, now)
+
+
+class StatusIngestionTests(TestCase):
+
+    def test_dispatchers_share_one_status_subscription(self):
+        with override_settings(MQTT_SHARED_SUBSCRIPTION_GROUP="ingest"):
+            self.assertEqual(subscription("pillbox/+/status"), "$share/ingest/pillbox/+/status")
+
+        with override_settings(MQTT_SHARED_SUBSCRIPTION_GROUP=""):
+            self.assertEqual(subscription("pillbox/+/status"), "pillbox/+/status")
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        ingestor = StatusIngestor(max_size=1)
+
+        self.assertTrue(ingestor.submit("pillbox/status", "{}"))
+        self.assertFalse(ingestor.submit("pillbox/status", "{}"))
+
+    def test_flush_writes_the_batch_and_projects_it(self):
+        seed(1)
+        box = PillBox.objects.get()
+        topic = f"pillbox/{box.device_id}/status"
+        now = timezone.now()
+
+        StatusIngestor().flush([
+            (topic, '{"slot1": "empty"}', now),
+            (topic, '{"slot1": "filled", "slot2": "empty"}', now),
+            ("pillbox/unknown/status", '{"slot1": "empty"}', now),
+        ])
+
+        self.assertEqual(PillEvent.objects.count(), 3)
+        self.assertEqual(
+            PillBoxStatus.objects.get(patient=box.patient).slot_status,
+            {"slot1": "filled", "slot2": "empty"}
+        )
+
+
+class HealthEndpointTests(TestCase):
+
+    class Worker:
+        report = {"ok": True}
+
+        def health(self):
+            return self.report
+
+    def get(self, server, path):
+        try:
+            with urlopen(f"http://127.0.0.1:{server.server_address[1]}{path}") as response:
+                return response.status, json.loads(response.read())
+        except HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def test_health_reflects_the_worker(self):
+        worker = self.Worker()
+        server = health_server(worker, 0)
+        self.addCleanup(server.shutdown)
+
+        self.assertEqual(self.get(server, "/health"), (200, {"ok": True}))
+
+        worker.report = {"ok": False}
+        self.assertEqual(self.get(server, "/health"), (503, {"ok": False}))
+
+    def test_job_failures_are_counted_until_a_run_succeeds(self):
+        outcomes = [DatabaseError("connection lost"), DatabaseError("connection lost"), None]
+
+        def flaky():
+            error = outcomes.pop(0)
+            if error:
+                raise error
+
+        job = Job(flaky)
+
+        job()
+        job()
+        self.assertEqual((job.failures, job.consecutive_failures), (2, 2))
+
+        job()
+        self.assertEqual((job.failures, job.consecutive_failures), (2, 0))
+
+
+class RecurrenceTests(TestCase):
+
+    def test_weekly_and_monthly_dates(self):
+        self.assertEqual(
+            list(islice(occurrence_dates("Weekly", date(2026, 1, 5), from_date=date(2026, 1, 7)), 2)),
+            [date(2026, 1, 12), date(2026, 1, 19)]
+        )
+
+        # The 31st falls back to the last day of shorter months
+        self.assertEqual(
+            list(occurrence_dates("Monthly", date(2026, 1, 31), date(2026, 4, 30))),
+            [date(2026, 1, 31), date(2026, 2, 28), date(2026, 3, 31), date(2026, 4, 30)]
+        )
+
+    def test_no_occurrence_after_end_date(self):
+        medication = Medication(
+            frequency="Daily",
+            time=time(8, 0),
+            start_date=date(2026, 1, 1),
+            end_date=date(2026, 1, 2)
+        )
+        tz = zone("UTC")
+
+        self.assertEqual(
+            next_occurrence(medication, datetime(2026, 1, 1, 9, tzinfo=tz), tz),
+            datetime(2026, 1, 2, 8, tzinfo=tz)
+        )
+        self.assertIsNone(next_occurrence(medication, datetime(2026, 1, 2, 9, tzinfo=tz), tz))
+
+    def test_only_schedule_edits_move_next_due_at(self):
+        seed(1)
+        medication = due_medication(Patient.objects.get(), due_at=timezone.now() + timedelta(hours=5))
+        due = medication.next_due_at
+
+        medication = Medication.objects.get(pk=medication.pk)
+        medication.dosage = "3"
+        medication.save()
+        self.assertEqual(medication.next_due_at, due)
+
+        medication.time = time(20, 0)
+        medication.save()
+        self.assertNotEqual(medication.next_due_at, due)
+        self.assertEqual(timezone.localtime(medication.next_due_at).time(), time(20, 0))
+
+
+class DoseMaterializationTests(TestCase):
+
+    def setUp(self):
+        seed(1)
+        self.patient = Patient.objects.get()
+
+    def test_saving_a_schedule_materializes_its_horizon_once(self):
+        schedule = PillSchedule.objects.create(
+            patient=self.patient,
+            pill_name="Aspirin",
+            dosage="1",
+            time=time(9, 0),
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=30)
+        )
+
+        doses = DoseInstance.objects.filter(schedule=schedule)
+        count = doses.count()
+
+        self.assertIn(count, (settings.DOSE_HORIZON_DAYS, settings.DOSE_HORIZON_DAYS + 1))
+
+        materialize_doses()
+        materialize_doses()
+
+        self.assertEqual(doses.count(), count)
+
+    def test_ended_schedules_get_no_doses(self):
+        PillSchedule.objects.create(
+            patient=self.patient,
+            pill_name="Old",
+            dosage="1",
+            time=time(9, 0),
+            start_date=date.today() - timedelta(days=30),
+            end_date=date.today() - timedelta(days=3)
+        )
+
+        materialize_doses()
+
+        self.assertFalse(DoseInstance.objects.filter(name="Old").exists())
+
+
+class PatientTimeZoneTests(TestCase):
+
+    def test_fire_times_follow_the_patient_time_zone(self):
+        patient = Patient.objects.create(name="Traveller", age=70, timezone="America/New_York")
+
+        medication = Medication.objects.create(
+            patient=patient,
+            name="Med",
+            dosage="1",
+            time=time(8, 0),
+            compartment=1,
+            start_date=date.today()
+        )
+
+        new_york = zone("America/New_York")
+        self.assertEqual(timezone.localtime(medication.next_due_at, new_york).time(), time(8, 0))
+
+        patient = Patient.objects.get(pk=patient.pk)
+        patient.timezone = "Asia/Tokyo"
+        patient.save()
+
+        tokyo = zone("Asia/Tokyo")
+        medication.refresh_from_db()
+
+        self.assertEqual(timezone.localtime(medication.next_due_at, tokyo).time(), time(8, 0))
+        self.assertEqual(
+            {timezone.localtime(dose.due_at, tokyo).time() for dose in medication.doses.filter(status=DoseInstance.PENDING)},
+            {time(8, 0)}
+        )
+
+
+class HeldMessageInfo:
+    """
+    A message paho queued without a connection: acknowledged only once
+    ``published`` is set.
+    """
+
+    rc = 0
+
+    def __init__(self):
+        self.published = False
+
+    def wait_for_publish(self, timeout=None):
+        pass
+
+    def is_published(self):
+        return self.published
+
+
+class HeldPublisher:
+    """
+    Publisher whose messages stay queued until the test acknowledges them.
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    def is_connected(self):
+        return True
+
+    def queue_depth(self):
+        return len(self.messages)
+
+    def publish(self, topic, payload):
+        info = HeldMessageInfo()
+        self.messages.append((topic, payload, info))
+        return info
+
+    def stop(self):
+        pass
+
+
+class DrainerDied(BaseException):
+    pass
+
+
+class DyingPublisher(HeldPublisher):
+    """
+    Publisher whose process dies mid-batch, before any outcome is recorded.
+    """
+
+    def publish(self, topic, payload):
+        raise DrainerDied()
+
+
+@override_settings(MQTT_PUBLISHER_CLASS='pilltracker_backend.api.tests.HeldPublisher')
+class OutboxTests(TestCase):
+
+    def retry_now(self):
+        MQTTOutbox.objects.update(next_attempt_at=timezone.now())
+
+    def test_unacknowledged_message_is_not_published_twice(self):
+        enqueue("pillbox/box-1/schedule", {"motor": 1})
+        publisher = get_publisher()
+
+        self.assertEqual(drain_outbox(), 0)
+        self.retry_now()
+        self.assertEqual(drain_outbox(), 0)
+        self.assertEqual(len(publisher.messages), 1)
+
+        row = MQTTOutbox.objects.get()
+        self.assertIsNone(row.delivered_at)
+        self.assertEqual(row.attempts, 2)
+
+        publisher.messages[0][2].published = True
+        self.retry_now()
+
+        self.assertEqual(drain_outbox(), 1)
+        self.assertEqual(len(publisher.messages), 1)
+        self.assertIsNotNone(MQTTOutbox.objects.get().delivered_at)
+
+    def test_claimed_rows_are_leased_to_one_drainer(self):
+        row = enqueue("pillbox/box-1/schedule", {"motor": 1})
+
+        with override_settings(MQTT_PUBLISHER_CLASS='pilltracker_backend.api.tests.DyingPublisher'):
+            with self.assertRaises(DrainerDied):
+                drain_outbox()
+
+        # Another drainer skips the leased row
+        publisher = get_publisher()
+        self.assertEqual(drain_outbox(), 0)
+        self.assertEqual(publisher.messages, [])
+
+        # Expired lease: redelivered, tagged with the row id for dedup
+        self.retry_now()
+        drain_outbox()
+
+        self.assertEqual(publisher.messages[0][1], {"motor": 1, "id": row.pk})
+
+
+@override_settings(MQTT_PUBLISHER_CLASS='pilltracker_backend.api.mqtt_client.LocalPublisher')
+class DeviceTopicTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME="localhost")
+        seed(1)
+
+    def test_commands_go_to_registered_box_only(self):
+        box = PillBox.objects.get()
+
+        response = self.client.post("/api/schedule/", {
+            "time": "08:00:00", "motor": 1, "device": box.device_id
+        }, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["topic"], f"pillbox/{box.device_id}/schedule")
+
+        response = self.client.post("/api/dispense/trigger/", {
+            "motor": 1, "device": "pillbox/#"
+        }, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(get_publisher().messages, [
+            (f"pillbox/{box.device_id}/schedule", '{"hour": 8, "minute": 0, "motor": 1, "dose": 1}')
+        ])
+
+    def test_explicit_patient_must_have_a_box(self):
+        box = PillBox.objects.get()
+        unboxed = Patient.objects.create(name="No Box", age=70)
+
+        for patient in ["abc", 999999, unboxed.pk]:
+            response = self.client.post("/api/dispense/trigger/", {
+                "motor": 1, "patient": patient
+            }, format="json")
+
+            self.assertEqual(response.status_code, 400)
+
+        response = self.client.post("/api/schedule/", {
+            "time": "08:00:00", "motor": 1, "patient": box.patient_id
+        }, format="json")
+
+        self.assertEqual(response.data["topic"], f"pillbox/{box.device_id}/schedule")
+
+        # Untargeted legacy calls keep the shared topic
+        response = self.client.post("/api/schedule/", {"time": "08:00:00", "motor": 1}, format="json")
+
+        self.assertEqual(response.data["topic"], "pillbox/schedule")
+
+    def test_device_id_is_topic_safe(self):
+        box = PillBox(device_id="box/1")
+
+        with self.assertRaises(ValidationError):
+            box.full_clean()
+
+
+class MissedDoseAlertTests(TestCase):
+
+    def setUp(self):
+        seed(1)
+        # Saved, not bulk created, so its doses are materialized
+        self.schedule = PillSchedule.objects.create(
+            patient=Patient.objects.get(),
+            pill_name="Aspirin",
+            dosage="1",
+            time=time(9, 0),
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=7)
+        )
+        self.dose = DoseInstance.objects.filter(schedule=self.schedule).order_by('due_at').first()
+        self.after_grace = self.dose.due_at + timedelta(seconds=settings.MISSED_DOSE_GRACE_SECONDS + 1)
+
+    def test_dose_is_missed_only_after_grace(self):
+        self.assertEqual(generate_missed_dose_alerts(self.dose.due_at + timedelta(minutes=1)), 0)
+        self.assertEqual(generate_missed_dose_alerts(self.after_grace), 1)
+
+        self.dose.refresh_from_db()
+        self.assertEqual(self.dose.status, DoseInstance.MISSED)
+
+    def test_repeated_sweeps_raise_one_alert_per_key(self):
+        self.assertEqual(generate_missed_dose_alerts(self.after_grace), 1)
+
+        # A dose re-opened (e.g. by a concurrent sweep) must not alert twice
+        DoseInstance.objects.filter(pk=self.dose.pk).update(status=DoseInstance.PENDING)
+
+        self.assertEqual(generate_missed_dose_alerts(self.after_grace), 0)
+
+        key = alert_dedup_key(
+            "Missed Dose",
+            self.schedule.pk,
+            timezone.localtime(self.dose.due_at, zone(self.schedule.patient.timezone)).date()
+        )
+        self.assertEqual(Alert.objects.filter(dedup_key=key).count(), 1)
+
+
+class StatusProjectionTests(TestCase):
+
+    def setUp(self):
+        seed(1)
+        self.box = PillBox.objects.get()
+        self.topic = f"pillbox/{self.box.device_id}/status"
+        self.now = timezone.now()
+
+    def slots(self):
+        return PillBoxStatus.objects.get(patient=self.box.patient).slot_status
+
+    def test_partial_reports_merge_and_late_reports_are_ignored(self):
+        project_status([
+            (self.topic, '{"slot2": "empty"}', self.now),
+            (self.topic, '{"slot2": "filled", "slot3": "empty"}', self.now - timedelta(seconds=5)),
+        ])
+
+        self.assertEqual(self.slots(), {"slot1": "filled", "slot2": "empty", "slot3": "empty"})
+
+        written = project_status([
+            (self.topic, '{"slot1": "empty"}', self.now - timedelta(seconds=1)),
+        ])
+
+        self.assertEqual(written, 0)
+        self.assertEqual(self.slots()["slot1"], "filled")
+
+
+class FailingBackend:
+
+    def send(self, recipient, alerts):
+        raise ConnectionError("SMTP down")
+
+
+@override_settings(
+    NOTIFICATION_BACKEND='pilltracker_backend.api.notifications.FileBackend',
+    NOTIFICATION_RECIPIENTS=['nurse@example.com', 'ops@example.com']
+)
+class NotificationTests(TestCase):
+
+    def setUp(self):
+        seed(3)
+
+        handle, self.path = tempfile.mkstemp(suffix=".jsonl")
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+        path = override_settings(NOTIFICATION_FILE_PATH=self.path)
+        path.enable()
+        self.addCleanup(path.disable)
+
+    def sent(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_one_batch_per_recipient(self):
+        self.assertEqual(run_notification_job(), 2)
+
+        batches = self.sent()
+
+        self.assertEqual(sorted(b["recipient"] for b in batches), ["nurse@example.com", "ops@example.com"])
+        self.assertTrue(all(len(b["alerts"]) == 3 for b in batches))
+        self.assertFalse(Notification.objects.exclude(status=Notification.SENT).exists())
+
+    @override_settings(NOTIFICATION_MAX_SENDS_PER_RUN=1)
+    def test_recipients_beyond_rate_limit_wait_for_next_run(self):
+        self.assertEqual(run_notification_job(), 1)
+        self.assertEqual(Notification.objects.filter(status=Notification.PENDING).count(), 3)
+
+        self.assertEqual(run_notification_job(), 1)
+        self.assertEqual(len(self.sent()), 2)
+
+    @override_settings(NOTIFICATION_MAX_ATTEMPTS=2)
+    def test_failed_batches_back_off_then_give_up(self):
+        run_notification_job()
+        Notification.objects.update(status=Notification.PENDING, next_attempt_at=timezone.now())
+
+        before = timezone.now()
+        self.assertEqual(send_notifications(FailingBackend()), 0)
+
+        row = Notification.objects.first()
+        self.assertEqual((row.status, row.attempts, row.last_error), (Notification.PENDING, 1, "SMTP down"))
+        self.assertGreaterEqual(row.next_attempt_at, before + timedelta(seconds=backoff(1)))
+
+        # Not due again until the backoff has passed
+        self.assertEqual(send_notifications(FailingBackend()), 0)
+        self.assertEqual(Notification.objects.get(pk=row.pk).attempts, 1)
+
+        Notification.objects.update(next_attempt_at=timezone.now())
+        send_notifications(FailingBackend())
+
+        self.assertFalse(Notification.objects.exclude(status=Notification.FAILED).exists())
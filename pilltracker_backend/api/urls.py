@@ -12,6 +12,7 @@ router.register(r'patients', views.PatientViewSet)
 router.register(r'schedules', views.PillScheduleViewSet)
 router.register(r'intakes', views.PillIntakeViewSet)
 router.register(r'pillbox', views.PillBoxStatusViewSet)
+router.register(r'devices', views.PillBoxViewSet)
 router.register(r'alerts', views.AlertViewSet)
 router.register(r'medications', views.MedicationViewSet)
 router.register(r'dispense', DispenseViewSet, basename='dispense')
@@ -27,4 +28,5 @@ urlpatterns = [
     path('patients/<int:pk>/', PatientDeleteView.as_view(), name='delete-patient'),
     path('schedule/', MQTTScheduleAPI.as_view(), name='mqtt-schedule'),
     path('save-schedule/', views.save_schedule, name='save-schedule'),
+    path('metrics/', views.metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -1,47 +1,103 @@
 
 import requests
+from datetime import timedelta
 from django.conf import settings
+from django.db import connection, transaction
 from django.utils import timezone
-from .models import PillSchedule, PillIntake, Alert
-def auto_generate_all_alerts():
-    auto_generate_missed_alerts()
-    check_late_intake()
-    check_refill()
-    now = timezone.localtime()
-    today = now.date()
-
-    schedules = PillSchedule.objects.all()
-
-    for schedule in schedules:
-        scheduled_time = timezone.make_aware(
-            timezone.datetime.combine(today, schedule.time)
-        )
-
-        # Check if already taken
-        intake = PillIntake.objects.filter(
-            schedule=schedule,
-            date=today,
-            taken=True
-        ).exists()
-
-        # If time passed & not taken → MISSED
-        if now > scheduled_time and not intake:
-
-            # Prevent duplicate alerts
-            already_exists = Alert.objects.filter(
-                patient=schedule.patient,
+from .metrics import observe_alerts
+from .models import Alert, DoseInstance
+from .recurrence import zone
+
+
+def reserve_writes(model):
+    """
+    On SQLite, take the database write lock now instead of at the first
+    write, waiting out the busy timeout. Two workers that both read
+    first would otherwise deadlock on the read-to-write lock upgrade, or
+    both claim the same rows. Call first thing inside
+    transaction.atomic(); the lock is held until commit. A no-op
+    elsewhere, where claims lock rows with SKIP LOCKED instead.
+    """
+    if connection.vendor != "sqlite":
+        return
+
+    with connection.cursor() as cursor:
+        # Any write statement takes the lock, even one matching no rows
+        cursor.execute(f"UPDATE {model._meta.db_table} SET id = id WHERE 0")
+
+
+def alert_dedup_key(alert_type, schedule_id, day):
+    return f"{alert_type}:schedule:{schedule_id}:{day.isoformat()}"
+
+
+def generate_missed_dose_alerts(now=None):
+    """
+    Mark every pending PillSchedule dose due more than
+    MISSED_DOSE_GRACE_SECONDS before ``now`` as missed (one range over
+    ``dose_pending_due_idx``) and raise one "Missed Dose"
+    alert per dose due within the last day. Alerts carry a dedup key of
+    schedule and day (in the patient's time zone): keys already raised
+    are skipped, and the unique index on it drops duplicates from a
+    concurrent run. Returns the number of alerts created (a concurrent
+    run may make this an overcount).
+    """
+    now = now or timezone.now()
+
+    with transaction.atomic():
+
+        missed = list(DoseInstance.objects.filter(
+            status=DoseInstance.PENDING,
+            schedule__isnull=False,
+            due_at__lte=now - timedelta(seconds=settings.MISSED_DOSE_GRACE_SECONDS)
+        ).values_list('pk', 'patient_id', 'schedule_id', 'name', 'due_at', 'patient__timezone'))
+
+        DoseInstance.objects.filter(
+            pk__in=[row[0] for row in missed],
+            status=DoseInstance.PENDING
+        ).update(status=DoseInstance.MISSED)
+
+        # Catch-up after downtime only alerts on the last day
+        recent = now - timedelta(days=1)
+
+        alerts = []
+
+        for pk, patient_id, schedule_id, name, due_at, tz in missed:
+
+            if due_at < recent:
+                continue
+
+            local_due = timezone.localtime(due_at, zone(tz))
+
+            alerts.append(Alert(
+                patient_id=patient_id,
+                message=f"Patient missed {name} dose at {local_due.strftime('%H:%M')}",
                 alert_type="Missed Dose",
-                created_at__date=today,
-                message__icontains=schedule.pill_name
-            ).exists()
+                dedup_key=alert_dedup_key("Missed Dose", schedule_id, local_due.date())
+            ))
+
+        raised = set(Alert.objects.filter(
+            dedup_key__in=[alert.dedup_key for alert in alerts]
+        ).values_list('dedup_key', flat=True))
+
+        alerts = [alert for alert in alerts if alert.dedup_key not in raised]
+
+        Alert.objects.bulk_create(alerts, ignore_conflicts=True)
+
+    return len(alerts)
+
+
+def run_alert_job():
+    """
+    Periodic missed-dose pass over the dose table.
+    """
+    created = generate_missed_dose_alerts()
+
+    observe_alerts(created)
 
-            if not already_exists:
-                Alert.objects.create(
-                    patient=schedule.patient,
-                    message=f"Patient missed {schedule.pill_name} dose at {schedule.time.strftime('%H:%M')}",
-                    alert_type="Missed Dose"
-                )
+    if created:
+        print(f"🚨 {created} missed dose alert(s) created")
 
+    return created
 
 
 def get_latest_feed_value(feed_name):
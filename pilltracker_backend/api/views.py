@@ -1,6 +1,8 @@
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
+from django.core.cache import cache
 from django.db import transaction
+from django.http import HttpResponse
 from django.utils import timezone
 
 from rest_framework import viewsets, status
@@ -11,11 +13,14 @@ from rest_framework.decorators import action, api_view
 
 import json
 import uuid
-from datetime import date
+from datetime import date, time
 
-import paho.mqtt.client as mqtt
-
-from .utils import auto_generate_all_alerts
+# notifications registers the pending-notifications gauge served here
+from . import metrics, notifications  # noqa: F401
+from .caching import next_medication_key, seconds_until
+from .mqtt_client import UnknownDevice, box_topic, get_publisher, patient_topic
+from .outbox import enqueue
+from .pagination import CreatedAtCursorPagination, TimestampCursorPagination
 
 from .models import (
     Doctor,
@@ -23,6 +28,7 @@ from .models import (
     PillSchedule,
     PillIntake,
     PillBoxStatus,
+    PillBox,
     Alert,
     RefillLog,
     Medication
@@ -36,6 +42,7 @@ from .serializers import (
     PillScheduleSerializer,
     PillIntakeSerializer,
     PillBoxStatusSerializer,
+    PillBoxSerializer,
     AlertSerializer,
     MedicationSerializer
 )
@@ -103,6 +110,8 @@ class DispenseViewSet(viewsets.ViewSet):
                 minute = int(request.GET.get("minute", 0))
                 motor = int(request.GET.get("motor", 1))
                 dose = int(request.GET.get("dose", 1))
+                device = request.GET.get("device")
+                patient = request.GET.get("patient")
 
             else:
 
@@ -110,6 +119,8 @@ class DispenseViewSet(viewsets.ViewSet):
                 minute = int(request.data.get("minute", 0))
                 motor = int(request.data.get("motor", 1))
                 dose = int(request.data.get("dose", 1))
+                device = request.data.get("device")
+                patient = request.data.get("patient")
 
             payload = {
                 "hour": hour,
@@ -118,28 +129,28 @@ class DispenseViewSet(viewsets.ViewSet):
                 "dose": dose
             }
 
-            client = mqtt.Client()
-
-            client.connect(
-                "broker.hivemq.com",
-                1883,
-                60
-            )
+            # Target one box: by device ID, else the patient's box
+            topic = box_topic(device, patient, "schedule")
 
-            client.publish(
-                "pillbox/schedule",
+            get_publisher().publish(
+                topic,
                 json.dumps(payload)
             )
 
-            client.disconnect()
-
             print("✅ MQTT SENT:", payload)
 
             return Response({
                 "status": "success",
+                "topic": topic,
                 "payload": payload
             })
 
+        except UnknownDevice as e:
+
+            return Response({
+                "error": str(e)
+            }, status=400)
+
         except Exception as e:
 
             print("❌ MQTT ERROR:", str(e))
@@ -169,7 +180,9 @@ def save_schedule(request):
                 "error": "hour, minute and motor required"
             }, status=400)
 
-        time_value = f"{int(hour):02d}:{int(minute):02d}:00"
+        dose_time = time(int(hour), int(minute))
+
+        time_value = dose_time.isoformat()
 
         patient = Patient.objects.first()
 
@@ -187,7 +200,7 @@ def save_schedule(request):
 
             dosage="1",
 
-            time=time_value,
+            time=dose_time,
 
             compartment=int(motor),
 
@@ -235,6 +248,10 @@ class MQTTScheduleAPI(APIView):
 
             dose = int(request.data.get("dose", 1))
 
+            device = request.data.get("device")
+
+            patient = request.data.get("patient")
+
             hour, minute, _ = map(
                 int,
                 time_str.split(":")
@@ -251,28 +268,28 @@ class MQTTScheduleAPI(APIView):
                 "dose": dose
             }
 
-            client = mqtt.Client()
-
-            client.connect(
-                "broker.hivemq.com",
-                1883,
-                60
-            )
+            # Target one box: by device ID, else the patient's box
+            topic = box_topic(device, patient, "schedule")
 
-            client.publish(
-                "pillbox/schedule",
+            get_publisher().publish(
+                topic,
                 json.dumps(payload)
             )
 
-            client.disconnect()
-
             print("✅ MQTT SENT:", payload)
 
             return Response({
                 "message": "Schedule sent successfully",
+                "topic": topic,
                 "payload": payload
             })
 
+        except UnknownDevice as e:
+
+            return Response({
+                "error": str(e)
+            }, status=400)
+
         except Exception as e:
 
             print("❌ MQTT ERROR:", str(e))
@@ -353,6 +370,16 @@ class PillBoxStatusViewSet(viewsets.ModelViewSet):
     serializer_class = PillBoxStatusSerializer
 
 
+# =========================================================
+# PILL BOX DEVICE REGISTRY VIEWSET
+# =========================================================
+class PillBoxViewSet(viewsets.ModelViewSet):
+
+    queryset = PillBox.objects.all()
+
+    serializer_class = PillBoxSerializer
+
+
 # =========================================================
 # ALERT VIEWSET
 # =========================================================
@@ -362,11 +389,10 @@ class AlertViewSet(viewsets.ModelViewSet):
 
     serializer_class = AlertSerializer
 
-    def list(self, request, *args, **kwargs):
-
-        auto_generate_all_alerts()
+    pagination_class = CreatedAtCursorPagination
 
-        return super().list(request, *args, **kwargs)
+    # Alerts are generated by utils.run_alert_job in the background;
+    # listing is a plain read
 
 
 # =========================================================
@@ -385,7 +411,7 @@ class MedicationViewSet(viewsets.ModelViewSet):
     # =========================================
     def get_queryset(self):
 
-        now = timezone.localtime().time()
+        now = timezone.now()
 
         patient_id = self.request.GET.get("patient")
 
@@ -395,68 +421,86 @@ class MedicationViewSet(viewsets.ModelViewSet):
         if patient_id:
             queryset = queryset.filter(patient_id=patient_id)
 
-        # GET CURRENT/NEXT MEDICINE
-        medication = queryset.filter(
-            time__gte=now
-        ).order_by('time')[:1]
-
-        # IF ALL TIMES PASSED
-        # RETURN FIRST MEDICINE OF NEXT CYCLE
-        if not medication.exists():
+        # Detail routes address any medication
+        if self.action != "list":
+            return queryset
 
-            medication = queryset.order_by('time')[:1]
+        # NEXT MEDICINE TO FIRE (None once its end date has passed)
+        medication = queryset.filter(
+            next_due_at__isnull=False,
+            next_due_at__gte=now
+        ).order_by('next_due_at').values('pk')[:1]
 
-        return medication
+        # Unsliced so the paginator can apply its ordering
+        return queryset.filter(pk__in=medication)
 
     # =========================================
-    # SAVE + MQTT
+    # CACHED POLL (invalidated by signals.py)
     # =========================================
-    def perform_create(self, serializer):
+    def list(self, request, *args, **kwargs):
 
-        obj = serializer.save()
+        # Paging through a cursor bypasses the cache
+        if request.GET.get("cursor"):
+            return super().list(request, *args, **kwargs)
 
-        try:
+        key = next_medication_key(request.GET.get("patient"))
 
-            time_str = str(obj.time)
+        # One entry per patient holding every page size served, so an
+        # invalidation drops them all
+        pages = cache.get(key) or {}
 
-            hour, minute, _ = map(
-                int,
-                time_str.split(":")
+        page_size = self.paginator.get_page_size(request)
+
+        data = pages.get(page_size)
+
+        if data is None:
+
+            data = super().list(request, *args, **kwargs).data
+
+            results = data["results"]
+
+            pages[page_size] = data
+
+            cache.set(
+                key,
+                pages,
+                seconds_until(results[0]["next_due_at"] if results else None)
             )
 
-            payload = {
+        return Response(data)
 
-                "hour": hour,
+    # =========================================
+    # SAVE + MQTT (OUTBOX)
+    # =========================================
+    @transaction.atomic
+    def perform_create(self, serializer):
 
-                "minute": minute,
+        obj = serializer.save()
 
-                "motor": int(obj.compartment),
+        time_str = str(obj.time)
 
-                "dose": int(obj.dosage)
-                if str(obj.dosage).isdigit()
-                else 1
-            }
+        hour, minute, _ = map(
+            int,
+            time_str.split(":")
+        )
 
-            client = mqtt.Client()
+        payload = {
 
-            client.connect(
-                "broker.hivemq.com",
-                1883,
-                60
-            )
+            "hour": hour,
 
-            client.publish(
-                "pillbox/schedule",
-                json.dumps(payload)
-            )
+            "minute": minute,
 
-            client.disconnect()
+            "motor": int(obj.compartment),
 
-            print("🔥 MQTT SENT:", payload)
+            "dose": int(obj.dosage)
+            if str(obj.dosage).isdigit()
+            else 1
+        }
 
-        except Exception as e:
+        # Delivered by the outbox drainer once this transaction commits
+        enqueue(patient_topic(obj.patient_id, "schedule"), payload)
 
-            print("❌ MQTT ERROR:", str(e))
+        print("🔥 MQTT QUEUED:", payload)
 
 
 # =========================================================
@@ -527,14 +571,20 @@ class RefillLogAPI(APIView):
 
     def get(self, request):
 
-        logs = RefillLog.objects.all()
+        paginator = TimestampCursorPagination()
+
+        logs = paginator.paginate_queryset(
+            RefillLog.objects.all(),
+            request,
+            view=self
+        )
 
         serializer = RefillLogSerializer(
             logs,
             many=True
         )
 
-        return Response(serializer.data)
+        return paginator.get_paginated_response(serializer.data)
 
 
 # =========================================================
@@ -549,3 +599,14 @@ class VoiceAgentAPI(APIView):
         return Response({
             "fulfillmentText": "Voice API working"
         })
+
+
+# =========================================================
+# METRICS (PROMETHEUS)
+# =========================================================
+def metrics_view(request):
+
+    return HttpResponse(
+        metrics.render(),
+        content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
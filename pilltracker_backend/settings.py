@@ -59,6 +59,7 @@ INSTALLED_APPS = [
 # -------------------------------------------------------------------
 
 MIDDLEWARE = [
+    'pilltracker_backend.api.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -69,6 +70,32 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per-request SQL / latency instrumentation (api/middleware.py)
+REQUEST_METRICS_ENABLED = os.environ.get('REQUEST_METRICS_ENABLED', '0') == '1'
+
+# Requests kept per endpoint for the rolling histograms
+REQUEST_METRICS_WINDOW = 1000
+
+# -------------------------------------------------------------------
+# LOGGING
+# -------------------------------------------------------------------
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'pilltracker_backend': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
 # -------------------------------------------------------------------
 # TEMPLATES
 # -------------------------------------------------------------------
@@ -106,6 +133,28 @@ DATABASES = {
     )
 }
 
+# -------------------------------------------------------------------
+# CACHE
+# -------------------------------------------------------------------
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Upper bound on how long a patient's next medication stays cached;
+# entries normally expire at the dose time or on a Medication change
+NEXT_MEDICATION_CACHE_SECONDS = 24 * 60 * 60
+
 # -------------------------------------------------------------------
 # PASSWORD VALIDATION
 # -------------------------------------------------------------------
@@ -163,6 +212,116 @@ CORS_ALLOW_CREDENTIALS = True
 LOGIN_REDIRECT_URL = '/api/'
 LOGOUT_REDIRECT_URL = '/api-auth/login/'
 
+# -------------------------------------------------------------------
+# MQTT SETTINGS
+# -------------------------------------------------------------------
+
+MQTT_BROKER_HOST = os.environ.get('MQTT_BROKER_HOST', 'broker.hivemq.com')
+MQTT_BROKER_PORT = int(os.environ.get('MQTT_BROKER_PORT', 1883))
+MQTT_KEEPALIVE = 60
+
+# LocalPublisher keeps messages in memory (tests, benchmarks)
+MQTT_PUBLISHER_CLASS = os.environ.get(
+    'MQTT_PUBLISHER_CLASS',
+    'pilltracker_backend.api.mqtt_client.MQTTPublisher'
+)
+
+# Messages held by the shared publisher while the broker is unreachable
+MQTT_MAX_QUEUED_MESSAGES = int(os.environ.get('MQTT_MAX_QUEUED_MESSAGES', 1000))
+
+# Outbox drainer: rows per batch, poll interval, broker ack timeout (s)
+# and retry backoff cap (s)
+MQTT_OUTBOX_BATCH_SIZE = 100
+MQTT_OUTBOX_DRAIN_SECONDS = 2
+MQTT_OUTBOX_PUBLISH_TIMEOUT = 5
+MQTT_OUTBOX_MAX_BACKOFF = 300
+
+# A claimed batch is retried after this long if its drainer died before
+# recording the outcome; longer than the ack timeout (seconds)
+MQTT_OUTBOX_LEASE_SECONDS = 60
+
+# Dispatcher processes subscribe to status topics as one MQTT shared
+# subscription group, so each message is ingested by one of them.
+# Empty subscribes plainly (brokers without $share): run one dispatcher.
+MQTT_SHARED_SUBSCRIPTION_GROUP = os.environ.get('MQTT_SHARED_SUBSCRIPTION_GROUP', 'pillbox-ingest')
+
+# Status ingestion: buffered messages before dropping, rows per
+# bulk insert and maximum time a message waits for a flush (ms)
+STATUS_INGEST_QUEUE_SIZE = 10000
+STATUS_INGEST_BATCH_SIZE = 500
+STATUS_INGEST_FLUSH_MS = 200
+
+# -------------------------------------------------------------------
+# BACKGROUND JOBS
+# -------------------------------------------------------------------
+
+# Interval of the missed-dose alert job (seconds)
+ALERT_JOB_SECONDS = 60
+
+# A dose counts as missed this long after it was due, leaving time to
+# record the intake (seconds)
+MISSED_DOSE_GRACE_SECONDS = int(os.environ.get('MISSED_DOSE_GRACE_SECONDS', 1800))
+
+# Dose instances are materialized this many days ahead, by a job
+# running every DOSE_MATERIALIZE_SECONDS
+DOSE_HORIZON_DAYS = int(os.environ.get('DOSE_HORIZON_DAYS', 7))
+DOSE_MATERIALIZE_SECONDS = 3600
+
+# Dose dispatcher: doses fire at most this late (milliseconds)
+DISPATCHER_JITTER_MS = int(os.environ.get('DISPATCHER_JITTER_MS', 500))
+
+# Re-read medications changed since the last pass (seconds)
+DISPATCHER_REFRESH_SECONDS = 5
+
+# Rebuild the whole schedule, dropping deleted medications (seconds)
+DISPATCHER_RELOAD_SECONDS = 300
+
+# Doses later than this are skipped instead of dispensed, e.g. after
+# downtime; anything within it is caught up on restart (seconds)
+DISPATCH_MISFIRE_GRACE_SECONDS = int(os.environ.get('DISPATCH_MISFIRE_GRACE_SECONDS', 3600))
+
+# Doses claimed per transaction; a catch-up runs as several batches
+DISPATCH_BATCH_SIZE = 1000
+
+# run_dispatcher serves /health and /metrics on this port (0 disables)
+DISPATCHER_HEALTH_PORT = int(os.environ.get('DISPATCHER_HEALTH_PORT', 8001))
+
+# /health fails once a background job has failed this many runs in a row
+WORKER_JOB_MAX_FAILURES = 3
+
+# -------------------------------------------------------------------
+# ALERT NOTIFICATIONS
+# -------------------------------------------------------------------
+
+# Channel backend: ConsoleBackend, FileBackend or EmailBackend in
+# pilltracker_backend.api.notifications, or any class with send()
+NOTIFICATION_BACKEND = os.environ.get(
+    'NOTIFICATION_BACKEND',
+    'pilltracker_backend.api.notifications.ConsoleBackend'
+)
+
+# FileBackend output (one JSON line per batch)
+NOTIFICATION_FILE_PATH = os.environ.get('NOTIFICATION_FILE_PATH', 'notifications.jsonl')
+
+# Always notified in addition to the patient's doctor (comma separated)
+NOTIFICATION_RECIPIENTS = [
+    address.strip()
+    for address in os.environ.get('NOTIFICATION_RECIPIENTS', '').split(',')
+    if address.strip()
+]
+
+# Job interval (s), pending rows read per run, recipients served per
+# run (rate limit), attempts before giving up and retry backoff cap (s)
+NOTIFICATION_SECONDS = 30
+NOTIFICATION_BATCH_SIZE = 1000
+NOTIFICATION_MAX_SENDS_PER_RUN = 20
+NOTIFICATION_MAX_ATTEMPTS = 8
+NOTIFICATION_MAX_BACKOFF = 3600
+
+# A claimed batch is retried after this long if its sender died before
+# recording the outcome (seconds)
+NOTIFICATION_LEASE_SECONDS = 300
+
 # -------------------------------------------------------------------
 # REST FRAMEWORK SETTINGS
 # -------------------------------------------------------------------
@@ -175,4 +334,5 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'pilltracker_backend.api.pagination.IdCursorPagination',
 }